@@ -0,0 +1,92 @@
+from xmltodict import _main
+import bz2
+import gzip
+import json
+import marshal
+import pytest
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    (tmp_path / 'a.xml').write_text('<a x="1"><b>1</b><b>2</b></a>')
+    (tmp_path / 'b.xml.gz').write_bytes(gzip.compress(b'<a><b>3</b></a>'))
+    (tmp_path / 'c.xml.bz2').write_bytes(bz2.compress(b'<a><b>4</b></a>'))
+    return tmp_path
+
+
+def _lines(output):
+    return [json.loads(line) for line in output.splitlines()]
+
+
+def test_jsonl_from_glob(inputs, capsysbinary):
+    assert _main([str(inputs / '*.xml*')]) == 0
+    assert _lines(capsysbinary.readouterr().out) == [
+        {'a': {'@x': '1', 'b': ['1', '2']}},
+        {'a': {'b': '3'}},
+        {'a': {'b': '4'}},
+    ]
+
+
+def test_item_depth_and_parse_options(inputs, capsysbinary):
+    assert _main(['-d', '2', '--force-list', 'b', '--no-attribs',
+                  str(inputs / 'a.xml')]) == 0
+    assert _lines(capsysbinary.readouterr().out) == ['1', '2']
+    assert _main(['--no-attribs', '--force-list', 'b',
+                  str(inputs / 'b.xml.gz')]) == 0
+    assert _lines(capsysbinary.readouterr().out) == [{'a': {'b': ['3']}}]
+
+
+def test_marshal_and_output_file(inputs, capsysbinary):
+    output = inputs / 'out.marshal'
+    assert _main(['-f', 'marshal', '-d', '2', '-o', str(output),
+                  str(inputs / 'a.xml')]) == 0
+    with open(output, 'rb') as f:
+        assert marshal.load(f) == ([('a', {'x': '1'}), ('b', None)], '1')
+
+
+def test_output_dir_with_workers(inputs, capsysbinary):
+    out_dir = inputs / 'out'
+    assert _main(['--output-dir', str(out_dir), '--workers', '2', '--stats',
+                  str(inputs / 'a.xml'), str(inputs / 'b.xml.gz')]) == 0
+    assert sorted(p.name for p in out_dir.iterdir()) == ['a.jsonl', 'b.jsonl']
+    assert _lines((out_dir / 'b.jsonl').read_bytes()) == [{'a': {'b': '3'}}]
+    assert b'2 files' in capsysbinary.readouterr().err
+
+
+def test_unparse(inputs, capsysbinary):
+    source = inputs / 'doc.json'
+    source.write_text(json.dumps({'a': {'@x': '1', 'b': ['1', '2']}}))
+    assert _main(['--unparse', '-f', 'json', str(source)]) == 0
+    assert capsysbinary.readouterr().out == (
+        b'<?xml version="1.0" encoding="utf-8"?>\n'
+        b'<a x="1"><b>1</b><b>2</b></a>\n')
+    source.write_text('{"b": "1"}\n{"b": {"@y": "2"}}\n')
+    assert _main(['--unparse', str(source)]) == 0
+    assert capsysbinary.readouterr().out == b'<b>1</b>\n<b y="2"></b>\n'
+
+
+def test_errors_are_reported(inputs, capsysbinary):
+    (inputs / 'bad.xml').write_text('<a>')
+    assert _main([str(inputs / 'bad.xml'), str(inputs / 'a.xml')]) == 1
+    captured = capsysbinary.readouterr()
+    assert b'bad.xml' in captured.err
+    assert _lines(captured.out) == [{'a': {'@x': '1', 'b': ['1', '2']}}]
+
+
+def test_unparse_records_under_root(inputs, capsysbinary):
+    source = inputs / 'records.jsonl'
+    source.write_text('{"@id": "1"}\n{"@id": "2"}\n')
+    assert _main(['--unparse', '--root', 'rows', '--item-name', 'row',
+                  str(source)]) == 0
+    assert capsysbinary.readouterr().out == (
+        b'<?xml version="1.0" encoding="utf-8"?>\n'
+        b'<rows><row id="1"></row><row id="2"></row></rows>\n')
+
+
+def test_indent(inputs, capsysbinary):
+    assert _main(['-f', 'json', '--indent', '1',
+                  str(inputs / 'b.xml.gz')]) == 0
+    assert capsysbinary.readouterr().out == (
+        b'{\n "a": {\n  "b": "3"\n }\n}\n')
+    with pytest.raises(SystemExit):
+        _main(['-d', '2', '--indent', '2', str(inputs / 'a.xml')])
@@ -1,6 +1,8 @@
-from xmltodict import parse, unparse
+from xmltodict import parse, unparse, compile_template, unparse_records
+from xmltodict import CompactNode
 import pytest
 import re
+from io import BytesIO
 from textwrap import dedent
 
 _HEADER_RE = re.compile(r'^[^\n]*\n')
@@ -710,3 +712,159 @@ def test_none_text_with_short_empty_elements_and_attributes():
 
 def test_none_attribute_serializes_as_empty_string():
     assert unparse({"x": {"@pro": None}}, full_document=False) == '<x pro=""></x>'
+
+
+class _CountingWriter:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def test_buffered_output():
+    obj = {'a': {'@x': '1', 'b': [str(i) for i in range(1000)]}}
+    unbuffered = _CountingWriter()
+    unparse(obj, unbuffered, buffer_size=0)
+    buffered = _CountingWriter()
+    unparse(obj, buffered, buffer_size=1024)
+    assert b''.join(buffered.chunks) == b''.join(unbuffered.chunks)
+    assert b''.join(buffered.chunks).decode() == unparse(obj)
+    assert len(buffered.chunks) < len(unbuffered.chunks) / 100
+
+
+def test_buffered_output_fragment_is_flushed():
+    output = BytesIO()
+    unparse({'a': 'b'}, output, full_document=False)
+    assert output.getvalue() == b'<a>b</a>'
+
+
+def test_as_bytes():
+    obj = {'a': {'@x': 'ü', 'b': ['1', '€']}}
+    assert unparse(obj, as_bytes=True) == unparse(obj).encode('utf-8')
+    assert unparse(obj, as_bytes=True, full_document=False,
+                   encoding='ascii') == (
+        b'<a x="&#252;"><b>1</b><b>&#8364;</b></a>')
+    assert unparse(obj, as_bytes=True, encoding='utf-16') == (
+        unparse(obj, encoding='utf-16').encode('utf-16'))
+
+
+_TEMPLATE_SAMPLE = {'r': {'@id': '1', '@ns:k': 'v', 'name': 'x',
+                          'v': ['1', '2'], 'e': None,
+                          'c': {'@a': 'b', '#text': 't'}}}
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'full_document': False},
+    {'pretty': True},
+    {'pretty': True, 'indent': 2, 'short_empty_elements': True},
+    {'short_empty_elements': True, 'encoding': 'ascii'},
+    {'namespaces': {'ns': 'urn:ns'}, 'attr_prefix': '@'},
+])
+@pytest.mark.parametrize('obj', [
+    _TEMPLATE_SAMPLE,
+    {'r': {'@id': 2, '@ns:k': None, 'name': True, 'v': [],
+           'e': '', 'c': {'@a': '<&">', '#text': None}}},
+    {'r': {'@id': '3', '@ns:k': 'v', 'name': '<x & y>', 'v': ('a', 'b'),
+           'e': [None, 'z'], 'c': [{'@a': '1', '#text': 't'}, 'plain']}},
+    # Shapes that differ from the sample fall back to unparse
+    {'r': {'@id': '4', 'name': {'first': 'a'}, 'v': [{'x': '1'}, '2'],
+           'e': None, 'c': {'#text': 't', '@a': 'b'}, '@ns:k': 'v'}},
+    {'r': {'@id': '5', '@ns:k': 'v', 'name': 'x', 'v': [[1, 2]],
+           'e': {'#comment': 'note'}, 'c': None}},
+    {'r': 'just text'},
+    {'other': {'a': '1'}},
+])
+def test_compile_template_matches_unparse(options, obj):
+    render = compile_template(_TEMPLATE_SAMPLE, **options)
+    assert render(obj) == unparse(obj, **options)
+
+
+def test_compile_template_errors():
+    render = compile_template({'a': {'b': '1'}})
+    with pytest.raises(ValueError):
+        render({'a': ['1', '2']})
+    with pytest.raises(ValueError):
+        render({'a': '1', 'b': '2'})
+    with pytest.raises(ValueError):
+        compile_template({'a': {'b c': '1'}})
+
+
+def test_compile_template_generic_options():
+    render = compile_template({'a': '1'},
+                              preprocessor=lambda k, v: (k.upper(), v))
+    assert render({'a': '2'}) == unparse({'A': '2'})
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'full_document': False},
+    {'pretty': True, 'indent': 2},
+    {'short_empty_elements': True},
+])
+def test_unparse_records_matches_unparse(options):
+    records = [{'@id': str(i), 'v': [str(i), None]} for i in range(5)]
+    expected = unparse({'rows': {'row': records}}, **options)
+    assert unparse_records(iter(records), 'rows', item_name='row',
+                           **options) == expected
+    keyed = ({'row': record} for record in records)
+    assert unparse_records(keyed, 'rows', **options) == expected
+
+
+def test_unparse_records_empty_and_root_attrs():
+    assert unparse_records([], 'rows', full_document=False) == '<rows></rows>'
+    assert unparse_records([], 'rows', pretty=True, full_document=False,
+                           short_empty_elements=True) == '<rows/>'
+    assert unparse_records([{'a': 1}], 'rows', root_attrs={'n': 1},
+                           full_document=False) == '<rows n="1"><a>1</a></rows>'
+
+
+def test_unparse_records_to_output():
+    output = BytesIO()
+    records = ({'r': str(i)} for i in range(1000))
+    assert unparse_records(records, 'rows', output) is None
+    assert parse(output.getvalue())['rows']['r'] == [
+        str(i) for i in range(1000)]
+    assert unparse_records([{'r': 'ü'}], 'rows', as_bytes=True,
+                           encoding='ascii', full_document=False) == (
+        b'<rows><r>&#252;</r></rows>')
+
+
+def _first_three_rows(key, value):
+    if isinstance(value, list):
+        return 'line', value[:3]
+    return key, value
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'pretty': True, 'indent': 2},
+    {'short_empty_elements': True, 'encoding': 'ascii', 'as_bytes': True},
+    {'preprocessor': _first_three_rows},
+    {'namespaces': {'urn:x': 'x'}},
+])
+@pytest.mark.parametrize('use_threads', [True, False])
+def test_unparse_workers_matches_serial(options, use_threads):
+    obj = {'root': {
+        '@n': '1',
+        'row': [{'@id': str(i), 'v': [str(i), None, 'ü']} for i in range(53)],
+        'urn:x:row': [str(i) for i in range(20)],
+        'small': ['a', 'b'],
+        'tail': {'#text': 't'},
+    }}
+    expected = unparse(obj, **options)
+    assert unparse(obj, workers=2, chunksize=5, use_threads=use_threads,
+                   **options) == expected
+
+
+def test_unparse_compact_node():
+    xml = ('<a xmlns:n="urn:n"><b x="1">t<c>1</c><c>2</c></b><b x="2"/>'
+           '<n:d/></a>')
+    tree = parse(xml, dict_constructor=CompactNode)
+    assert unparse(tree) == unparse(parse(xml))
+    assert compile_template(tree)(tree) == unparse(parse(xml))
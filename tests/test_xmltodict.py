@@ -1,7 +1,18 @@
-from xmltodict import parse, ParsingInterrupted
+from xmltodict import parse, parse_many, ParsingInterrupted, Checkpoint
+from xmltodict import build_index, fetch, LimitExceeded, xml_to_json
+from xmltodict import CompactNode, Path, CachedParser
+from xmltodict import dump_snapshot, load_snapshot, load_sqlite, xml_to_csv
+from xmltodict import scan, partition, find_first, find_all, follow
 import collections
+import json
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
 import pytest
-from io import BytesIO
+import xmltodict
+from io import BytesIO, StringIO
 
 from xml.parsers.expat import ParserCreate
 from xml.parsers import expat
@@ -160,6 +171,81 @@ def test_streaming():
     assert cb.count == 3
 
 
+def test_streaming_immutable_path():
+    paths = []
+    parents = []
+
+    def cb(path, item):
+        paths.append(path)
+        return True
+
+    def force_list(path, key, value):
+        parents.append(path)
+        return False
+
+    xml = '<a x="y"><b>1</b><c><b>2</b></c></a>'
+    parse(xml, item_depth=2, item_callback=cb, immutable_path=True)
+    assert paths == [[('a', {'x': 'y'}), ('b', None)],
+                     [('a', {'x': 'y'}), ('c', None)]]
+    assert isinstance(paths[0], Path)
+    assert paths[0][:-1] is paths[1][:-1]
+    assert paths[1].names == ('a', 'c') and paths[1][-1] == ('c', None)
+    assert len({paths[0], paths[1],
+                Path().child('a', {'x': 'y'}).child('b')}) == 2
+    parse(xml, force_list=force_list, immutable_path=True, path_attribs=False)
+    assert parents == [[('a', None)], [('a', None), ('c', None)],
+                       [('a', None)], []]
+    assert parents[0] is parents[2]
+
+
+def test_path_sequence_api():
+    path = Path().child('a', {'x': 'y'}).child('b').child('c')
+    assert list(path) == [('a', {'x': 'y'}), ('b', None), ('c', None)]
+    assert path[0] == ('a', {'x': 'y'}) and path[-2] == ('b', None)
+    assert path[:2] is path.parent and path[:] is path
+    assert path[1::2] == (('b', None),)
+    assert path == tuple(path) and path != [] and path != 'abc'
+    with pytest.raises(IndexError):
+        path[3]
+    assert repr(path[:1]) == "Path([('a', {'x': 'y'})])"
+
+
+def test_streaming_sampling():
+    xml = ('<r xmlns:n="urn:n">' + ''.join(
+        f'<i n="{i}"><x xmlns:m="urn:m">{i}</x><!--c--></i>'
+        for i in range(20)) + '</r>')
+
+    def sample(**kwargs):
+        items = []
+        parse(xml, item_depth=2, process_comments=True,
+              process_namespaces=True, **kwargs,
+              item_callback=lambda path, item: items.append(item) or True)
+        return items
+
+    every = sample(sample_every=5)
+    assert [item['@n'] for item in every] == ['0', '5', '10', '15']
+    assert every[1] == {'@n': '5', 'x': {'@xmlns': {'m': 'urn:m'},
+                                         '#text': '5'}, '#comment': 'c'}
+    fraction = sample(sample_fraction=0.3, sample_seed=1)
+    assert fraction == sample(sample_fraction=0.3, sample_seed=1)
+    assert 0 < len(fraction) < 20
+    reservoir = sample(sample_size=3, sample_seed=2)
+    indices = [int(item['@n']) for item in reservoir]
+    assert len(indices) == 3 and indices == sorted(indices)
+    assert len(sample(sample_size=30)) == 20
+    assert len(sample(sample_every=2, sample_size=4)) == 4
+    with pytest.raises(ValueError):
+        parse(xml, sample_every=2)
+    for invalid in ({'sample_every': 0}, {'sample_fraction': 1.5},
+                    {'sample_fraction': -0.1}, {'sample_size': -1}):
+        with pytest.raises(ValueError):
+            sample(**invalid)
+    assert sample(sample_size=0) == []
+    with pytest.raises(LimitExceeded):
+        parse(xml, item_depth=2, item_callback=lambda *args: True,
+              sample_every=100, max_depth=2)
+
+
 def test_streaming_interrupt():
     def cb(path, item):
         return False
@@ -627,3 +713,640 @@ def test_namespace_on_root_without_other_attrs():
         }
     }
     assert parse(xml, process_namespaces=True, namespaces=namespaces) == expected
+
+
+def test_parse_many_serial():
+    docs = ['<a>%d</a>' % i for i in range(10)]
+    assert list(parse_many(docs, workers=1, chunksize=3)) == [
+        {'a': str(i)} for i in range(10)]
+
+
+def test_parse_many_threads_ordered():
+    docs = (f'<a x="{i}"><b>{i}</b></a>' for i in range(50))
+    results = list(parse_many(docs, workers=3, chunksize=4,
+                              use_threads=True, force_list=('b',)))
+    assert results == [{'a': {'@x': str(i), 'b': [str(i)]}}
+                       for i in range(50)]
+
+
+def test_parse_many_unordered():
+    docs = ['<a>%d</a>' % i for i in range(20)]
+    results = parse_many(docs, workers=2, chunksize=3, ordered=False,
+                         use_threads=True)
+    assert sorted(results) == [(i, {'a': str(i)}) for i in range(20)]
+
+
+def test_parse_many_processes():
+    docs = [b'<a>1</a>', b'<a>2</a>', b'<a>3</a>']
+    assert list(parse_many(docs, workers=2, chunksize=2)) == [
+        {'a': '1'}, {'a': '2'}, {'a': '3'}]
+
+
+def test_parse_many_error():
+    with pytest.raises(expat.ExpatError):
+        list(parse_many(['<a>', '<a/>'], workers=1))
+
+
+def _collect(xml, **kwargs):
+    items = []
+
+    def handler(path, item, checkpoint):
+        items.append((path[:], item, checkpoint))
+        return True
+
+    parse(xml, item_depth=2, item_callback=handler, checkpoints=True,
+          **kwargs)
+    return items
+
+
+def test_checkpoints():
+    xml = b'<?xml version="1.0"?>\n<a x="1">\n <b y="&gt;"/>\n <b>t</b  ></a>'
+    items = _collect(xml)
+    assert [item for _, item, _ in items] == [{'@y': '>'}, 't']
+    assert items[0][2] == Checkpoint(xml.index(b'\n <b>'), (22,))
+    assert items[1][2] == Checkpoint(len(xml) - len(b'</a>'), (22,))
+    assert _collect(BytesIO(xml)) == items
+    assert _collect(chunk for chunk in [xml[:5], xml[5:]]) == items
+    long_xml = b'<a>' + b'<b>t</b>' * 1000 + b'</a>'
+    assert _collect(chunk for chunk in [long_xml]) == _collect(long_xml)
+
+
+def test_resume_from_checkpoint():
+    xml = (b'<?xml version="1.0"?>\n<root xmlns="urn:r" v="2">'
+           + b''.join(b'<i n="%d"><v>%d</v></i>' % (n, n) for n in range(5))
+           + b'<i n="5"/></root>')
+    items = _collect(xml, process_namespaces=True)
+    assert len(items) == 6
+    for position, (_, _, checkpoint) in enumerate(items):
+        resumed = _collect(BytesIO(xml), process_namespaces=True,
+                           resume_from=list(checkpoint))
+        assert resumed == items[position + 1:]
+
+
+def test_resume_from_checkpoint_nested():
+    xml = ('<a><b id="1"><c>1</c><c>2</c></b>'
+           '<b id="2"><c>3</c></b><b/></a>')
+    items = []
+
+    def handler(path, item, checkpoint):
+        items.append((path[:], item, checkpoint))
+        return True
+
+    parse(xml, item_depth=3, item_callback=handler, checkpoints=True)
+    resumed = []
+    parse(xml, item_depth=3, checkpoints=True, resume_from=items[0][2],
+          item_callback=lambda p, i, c: resumed.append((p[:], i, c)) or True)
+    assert resumed == items[1:]
+    assert resumed[-1][0] == [('a', None), ('b', {'id': '2'}), ('c', None)]
+
+
+def test_resume_requires_seekable_input():
+    with pytest.raises(ValueError):
+        parse((chunk for chunk in [b'<a><b/></a>']), item_depth=2,
+              resume_from=Checkpoint(7, (0,)))
+
+
+def test_build_index_and_fetch(tmp_path):
+    source = tmp_path / 'dump.xml'
+    source.write_bytes(
+        b'<?xml version="1.0"?>\n<dump xmlns:x="urn:x">\n'
+        + b''.join(b' <rec id="r%d"><x:v>%d</x:v></rec>\n' % (n, n)
+                   for n in range(100))
+        + b' <rec id="last"/>\n</dump>')
+    index_path = tmp_path / 'dump.idx'
+    index = build_index(str(source), str(index_path), key='@id',
+                        process_namespaces=True)
+    assert len(index) == 101
+    assert fetch(str(index_path), 'r42', process_namespaces=True) == {
+        '@id': 'r42', 'urn:x:v': '42'}
+    assert fetch(index, 'last', process_namespaces=True) == {'@id': 'last'}
+    with pytest.raises(KeyError):
+        fetch(index, 'missing')
+
+
+def test_build_index_key_with_attributes(tmp_path):
+    source = tmp_path / 'dump.xml'
+    source.write_text('<a><i><id>1</id></i><i><id t="x">2</id></i></a>')
+    index = build_index(str(source), key='id')
+    assert fetch(index, '1') == {'id': '1'}
+    assert fetch(index, '2') == {'id': {'@t': 'x', '#text': '2'}}
+    source.write_text('<a><i><id>1</id><id>2</id></i></a>')
+    with pytest.raises(ValueError):
+        build_index(str(source), key='id')
+
+
+def test_build_index_positional(tmp_path):
+    source = tmp_path / 'dump.xml'
+    source.write_text('<a><b><c>1</c><c>2</c></b><b><c>3</c></b></a>')
+    index = build_index(str(source), item_depth=3)
+    assert [fetch(index, n) for n in range(len(index))] == ['1', '2', '3']
+    source.write_text('<a/>')
+    with pytest.raises(ValueError):
+        fetch(index, 0)
+
+
+def test_whitespace_between_elements_is_dropped():
+    xml = '<a>\n  <b>1</b>\n  <c> x </c>\n  <d>\n  </d>\n</a>'
+    assert parse(xml) == {'a': {'b': '1', 'c': 'x', 'd': None}}
+
+
+def test_whitespace_in_mixed_content():
+    assert parse('<a>x<b/> <c/>y</a>') == {
+        'a': {'b': None, 'c': None, '#text': 'x y'}}
+    assert parse('<a> <b/>x</a>', cdata_separator='|') == {
+        'a': {'b': None, '#text': '|x'}}
+    assert parse('<a> <b/> </a>', strip_whitespace=False) == {
+        'a': {'b': None, '#text': '  '}}
+
+
+def test_whitespace_item_at_item_depth():
+    items = []
+    parse('<a><b> </b></a>', item_depth=2,
+          item_callback=lambda path, item: items.append(item) or True)
+    assert items == [' ']
+
+
+def test_limits_within_bounds():
+    xml = '<a x="1"><b>text</b><b>more</b></a>'
+    assert parse(xml, max_depth=2, max_elements=3, max_attributes=1,
+                 max_text_length=4, max_bytes=len(xml)) == parse(xml)
+
+
+@pytest.mark.parametrize('xml, limit', [
+    ('<a><b><c/></b></a>', {'max_depth': 2}),
+    ('<a><b/><b/><b/></a>', {'max_elements': 3}),
+    ('<a x="1" y="2"/>', {'max_attributes': 1}),
+    ('<a>12345</a>', {'max_text_length': 4}),
+    ('<a><!--x-->12<b/>345</a>', {'max_text_length': 4}),
+    ('<a>12345</a>', {'max_bytes': 10}),
+])
+def test_limits_exceeded(xml, limit):
+    with pytest.raises(LimitExceeded):
+        parse(xml, **limit)
+    with pytest.raises(ValueError):
+        parse(BytesIO(xml.encode()), **limit)
+
+
+def test_max_text_length_many_chunks():
+    xml = '<a>' + 'x<b/>' * 100000 + '</a>'
+    assert parse(xml, max_text_length=100000)['a']['#text'] == 'x' * 100000
+    with pytest.raises(LimitExceeded):
+        parse(xml, max_text_length=99999)
+    xml = '<a>12<b>3456</b>34</a>'
+    assert parse(xml, max_text_length=4) == parse(xml)
+    with pytest.raises(LimitExceeded):
+        parse(xml, max_text_length=3)
+
+
+def test_max_bytes_generator():
+    chunks = (b'<a>' if i == 0 else b'<b/>' for i in range(1000))
+    with pytest.raises(LimitExceeded):
+        parse(chunks, max_bytes=100)
+
+
+def test_intern_values():
+    xml = ('<a>' + '<b c="USD">true</b>' * 3 +
+           '<d>' + 'x' * 100 + '</d><d>' + 'x' * 100 + '</d></a>')
+    result = parse(xml.encode(), intern_values=True)
+    assert result == parse(xml)
+    b = result['a']['b']
+    assert b[0]['#text'] is b[1]['#text'] is b[2]['#text']
+    assert b[0]['@c'] is b[1]['@c']
+    assert list(b[0])[0] is list(b[1])[0]
+    d = result['a']['d']
+    assert d[0] == d[1] and d[0] is not d[1]
+    xml = '<a><b>10</b><b>20</b><b>10</b><b>20</b></a>'
+    b = parse(xml, intern_values=2)['a']['b']
+    assert b[0] is b[2] and b[1] is not b[3]
+
+
+def test_attributes_with_namespace_declarations():
+    xml = '<a xmlns:n="urn:n" n:x="1" y="2"><b/></a>'
+    expected = {'a': {'@urn:n:x': '1', '@y': '2', '@xmlns': {'n': 'urn:n'},
+                      'b': None}}
+    assert parse(xml, process_namespaces=True) == expected
+    assert parse(xml, process_namespaces=True, intern_values=True) == expected
+
+    def postprocessor(path, key, value):
+        return key.upper(), value
+    result = parse(xml, process_namespaces=True, postprocessor=postprocessor)
+    assert list(result['A']) == ['@URN:N:X', '@Y', '@XMLNS', 'B']
+
+
+def test_compact_node_parse():
+    xml = ('<a xmlns:n="urn:n"><b x="1">t<c>1</c><c>2</c></b><b x="2"/>'
+           '<n:d/></a>')
+    result = parse(xml, dict_constructor=CompactNode)
+    assert isinstance(result['a'], CompactNode)
+    assert result == parse(xml)
+    assert result['a'].to_dict() == parse(xml)['a']
+    assert type(result['a'].to_dict()['b'][0]) is dict
+    first, second = result['a']['b']
+    assert list(first) == ['@x', 'c', '#text']
+    assert first['c'] == ['1', '2']
+    assert second._keys is parse('<b x="3"/>',
+                                 dict_constructor=CompactNode)['b']._keys
+    assert pickle.loads(pickle.dumps(result)) == result
+
+
+def test_compact_node_shapes_after_cache_fills(monkeypatch):
+    monkeypatch.setattr(CompactNode, '_shapes', {})
+    monkeypatch.setattr(CompactNode, '_old_shapes', {})
+    monkeypatch.setattr(CompactNode, '_max_shapes', 10)
+    hot = parse('<a><b>1</b><c>2</c></a>', dict_constructor=CompactNode)
+    for n in range(100):
+        parse(f'<a><k{n}>1</k{n}></a>', dict_constructor=CompactNode)
+        assert parse('<a><b>3</b><c>4</c></a>',
+                     dict_constructor=CompactNode)['a']._keys is (
+            hot['a']._keys)
+    first, second = (parse('<a><new>1</new><keys/></a>',
+                           dict_constructor=CompactNode) for _ in range(2))
+    assert first['a']._keys is second['a']._keys
+    assert len(CompactNode._shapes) <= 10
+
+
+def test_compact_node_mapping_api():
+    node = CompactNode([('a', 1), ('b', 2), ('a', 3)])
+    assert list(node.items()) == [('a', 3), ('b', 2)]
+    assert len(node) == 2 and 'b' in node and 'c' not in node
+    assert node.get('c') is None
+    with pytest.raises(KeyError):
+        node['c']
+    node['c'] = 4
+    node['a'] = 5
+    del node['b']
+    assert node == {'a': 5, 'c': 4}
+    assert repr(node) == "CompactNode([('a', 5), ('c', 4)])"
+    with pytest.raises(KeyError):
+        del node['b']
+
+
+def test_cached_parser_hits_and_copies():
+    parser = CachedParser(force_list=('b',))
+    xml = '<a><b>1</b></a>'
+    first = parser.parse(xml)
+    first['a']['b'].append('2')
+    assert parser.parse(BytesIO(xml.encode())) == {'a': {'b': ['1']}}
+    assert parser.parse(xml, force_list=None) == {'a': {'b': '1'}}
+    info = parser.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+    parser.cache_clear()
+    assert parser.cache_info() == (0, 0, 0, 0, 0)
+    with pytest.raises(ValueError):
+        parser.parse(xml, item_depth=1)
+
+
+def test_cached_parser_eviction():
+    parser = CachedParser(maxsize=2)
+    for i in range(3):
+        parser.parse(f'<a>{i}</a>')
+    parser.parse('<a>0</a>')
+    assert parser.cache_info().misses == 4
+    size = parser.cache_info().nbytes // 2
+    parser = CachedParser(maxsize=None, max_bytes=2 * size)
+    for i in range(3):
+        parser.parse(f'<a>{i}</a>')
+    assert parser.cache_info().currsize == 2
+    parser.parse('<a>2</a>')
+    assert parser.cache_info().hits == 1
+
+
+def test_cached_parser_cache_dir(tmp_path):
+    xml = '<a x="1"><b/></a>'
+    CachedParser(cache_dir=str(tmp_path)).parse(xml)
+    parser = CachedParser(cache_dir=str(tmp_path))
+    assert parser.parse(xml) == parse(xml)
+    assert parser.cache_info().disk_hits == 1
+    compact = CachedParser(cache_dir=str(tmp_path),
+                           dict_constructor=CompactNode)
+    assert isinstance(compact.parse(xml)['a'], CompactNode)
+    assert isinstance(compact.parse(xml)['a'], CompactNode)
+
+    def postprocessor(path, key, value):
+        return key, object() if key == 'b' else value
+    files = len(list(tmp_path.iterdir()))
+    parser.parse(xml, postprocessor=postprocessor)
+    assert len(list(tmp_path.iterdir())) == files
+    assert type(parser.parse(xml, postprocessor=postprocessor)['a']['b']) \
+        is object
+
+
+def test_cached_parser_distinct_callables():
+    def make(suffix):
+        def postprocessor(path, key, value):
+            return key, value + suffix
+        return postprocessor
+
+    parser = CachedParser()
+    for i in range(200):
+        assert parser.parse('<a>x</a>', postprocessor=make(str(i))) == {
+            'a': 'x' + str(i)}
+    assert parser.cache_info().hits == 0
+
+
+def test_cached_parser_set_options_across_processes(tmp_path):
+    script = (
+        'import sys, xmltodict\n'
+        'parser = xmltodict.CachedParser(cache_dir=sys.argv[1],\n'
+        '                                force_list={"b", "c", "d", "e"})\n'
+        'parser.parse("<a><b/></a>")\n'
+        'print(parser.cache_info().disk_hits)\n')
+    runs = []
+    for seed in ('1', '2', '3'):
+        result = subprocess.run(
+            [sys.executable, '-c', script, str(tmp_path)],
+            capture_output=True, text=True, check=True,
+            env=dict(os.environ, PYTHONHASHSEED=seed,
+                     PYTHONPATH=os.path.dirname(xmltodict.__file__)))
+        runs.append(result.stdout.strip())
+    assert runs == ['0', '1', '1']
+
+
+def test_snapshot_roundtrip(tmp_path):
+    xml = ('<a x="1"><b>USD</b><b>USD</b><c n="2.5"/><d/>'
+           '<!-- c --></a>')
+    tree = parse(xml, process_comments=True)
+    output = BytesIO()
+    dump_snapshot(tree, output)
+    output.seek(0)
+    loaded = load_snapshot(output)
+    assert loaded == tree
+    assert loaded['a']['b'][0] is loaded['a']['b'][1]
+    path = tmp_path / 'tree.snapshot'
+    dump_snapshot(parse(xml, dict_constructor=CompactNode,
+                        process_comments=True), str(path))
+    assert load_snapshot(str(path)) == tree
+    assert type(load_snapshot(str(path))['a']) is dict
+    with pytest.raises(ValueError):
+        load_snapshot(BytesIO(b'not a snapshot'))
+
+
+def test_load_sqlite(tmp_path):
+    xml = ('<r><i id="1" z="007"><n>a</n><t k="x"/><t k="y"/><p>1.5</p></i>'
+           '<i id="2" z="10"><n>b</n><p>2.25</p></i>'
+           '<i id="3"><extra>e</extra></i></r>')
+    database = str(tmp_path / 'test.db')
+    assert load_sqlite(xml, database, 'items', batch_size=2) == 3
+    connection = sqlite3.connect(database)
+    assert connection.execute('SELECT * FROM items').fetchall() == [
+        (1, '007', 'a', '["x", "y"]', 1.5),
+        (2, '10', 'b', None, 2.25),
+        (3, None, None, None, None),
+    ]
+    columns = {'id': '@id', 'kind': 't/@k', 'extra': 'extra'}
+    assert load_sqlite(BytesIO(xml.encode()), connection, 'selected',
+                       columns=columns, sep='/') == 3
+    assert connection.execute('SELECT * FROM selected').fetchall() == [
+        (1, '["x", "y"]', None), (2, None, None), (3, None, 'e')]
+
+
+def test_load_sqlite_keeps_values_that_do_not_round_trip():
+    xml = ('<r><i><id>123456789012345678901234</id><n>9223372036854775807</n>'
+           '<p>1.10</p><q>2</q><q>1.5</q></i></r>')
+    connection = sqlite3.connect(':memory:')
+    load_sqlite(xml, connection, 'items')
+    assert connection.execute('SELECT * FROM items').fetchall() == [
+        ('123456789012345678901234', 9223372036854775807, '1.10',
+         '["2", "1.5"]')]
+    load_sqlite('<r><i><q>2</q></i><i><q>1.5</q></i></r>', connection, 'q')
+    assert connection.execute('SELECT * FROM q').fetchall() == [
+        ('2',), ('1.5',)]
+
+
+def test_load_sqlite_rolls_back():
+    connection = sqlite3.connect(':memory:')
+    with pytest.raises(expat.ExpatError):
+        load_sqlite('<r><i>1</i><i>2</i><i>', connection, 'items',
+                    batch_size=1)
+    assert connection.execute('SELECT count(*) FROM items').fetchall() == [
+        (0,)]
+
+
+def test_xml_to_csv():
+    xml = ('<r><i id="1"><t k="a">x</t><t k="b"/><n>q</n></i>'
+           '<i id="2"><n>w,"z</n></i><i>text</i></r>')
+    assert xml_to_csv(xml, batch_size=1).splitlines() == [
+        '@id,t.@k,t.#text,n',
+        '1,a|b,x|,q',
+        '2,,,"w,""z"',
+        ',,,',
+    ]
+    assert xml_to_csv(xml, lists='explode').splitlines() == [
+        '@id,t.@k,t.#text,n,#text',
+        '1,a,x,q,',
+        '1,b,,q,',
+        '2,,,"w,""z",',
+        ',,,,text',
+    ]
+    output = StringIO(newline='')
+    columns = {'id': '@id', 'kind': 't/@k'}
+    assert xml_to_csv(xml, output, columns=columns, sep='/',
+                      dialect='excel-tab', list_separator=';') is None
+    assert output.getvalue() == 'id\tkind\r\n1\ta;b\r\n2\t\r\n\t\r\n'
+    assert xml_to_csv('<r/>', columns=['a', 'b']) == 'a,b\r\n'
+    with pytest.raises(ValueError):
+        xml_to_csv(xml, lists='split')
+
+
+def test_scan():
+    xml = ('<a><b x="1">hi</b><b/>'
+           '<c>  <d>12345678</d><d y="2" x="3">  </d></c>'
+           '<c><d>' + 'x' * 20 + '</d><e/></c></a>')
+    result = scan(xml.encode())
+    assert result.elements == {('a',): 1, ('a', 'b'): 2, ('a', 'c'): 2,
+                               ('a', 'c', 'd'): 3, ('a', 'c', 'e'): 1}
+    assert result.attributes == {('a', 'b'): {'x': 1},
+                                 ('a', 'c', 'd'): {'y': 1, 'x': 1}}
+    assert result.text_lengths == {('a', 'b'): {2: 1},
+                                   ('a', 'c', 'd'): {8: 1, 16: 1}}
+    assert result.max_depth == 3
+    assert result.repeated == {('a', 'b'), ('a', 'c'), ('a', 'c', 'd')}
+    assert scan(BytesIO(xml.encode())) == result
+    result = scan('<a xmlns="urn:x"><b/></a>', process_namespaces=True)
+    assert result.elements == {('urn:x:a',): 1, ('urn:x:a', 'urn:x:b'): 1}
+    assert result.repeated == set()
+
+
+PARTITION_XML = ('<orders>' + ''.join(
+    f'<order id="{i}" customer="{"ab"[i % 2]}"><n>{i}</n></order>'
+    for i in range(7)) + '<order id="7"/></orders>')
+
+
+@pytest.mark.parametrize('max_open', [1, 8])
+def test_partition_jsonl(tmp_path, max_open):
+    counts = partition(PARTITION_XML, '@customer',
+                       str(tmp_path / '{key}.jsonl'), max_open=max_open)
+    assert counts == {'a': 4, 'b': 3, 'None': 1}
+    lines = (tmp_path / 'b.jsonl').read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'@id': str(i), '@customer': 'b', 'n': str(i)} for i in (1, 3, 5)]
+
+
+@pytest.mark.parametrize('max_open', [1, 8])
+def test_partition_xml(tmp_path, max_open):
+    def key(path, item):
+        return int(item['@id']) % 3
+
+    counts = partition(BytesIO(PARTITION_XML.encode()), key,
+                       lambda name: str(tmp_path / f'{name}.xml'),
+                       format='xml', max_open=max_open,
+                       unparse_options={'pretty': True})
+    assert counts == {'0': 3, '1': 3, '2': 2}
+    orders = parse((tmp_path / '2.xml').read_bytes())['orders']['order']
+    assert orders == [parse(PARTITION_XML)['orders']['order'][i]
+                      for i in (2, 5)]
+    partition(PARTITION_XML, 'n', str(tmp_path / '{key}.xml'), format='xml',
+              root='all', item_name='o')
+    assert parse((tmp_path / '6.xml').read_bytes()) == {
+        'all': {'o': {'@id': '6', '@customer': 'a', 'n': '6'}}}
+
+
+def test_partition_jsonl_root_items(tmp_path):
+    counts = partition('<order customer="a"><n>1</n></order>', '@customer',
+                       str(tmp_path / '{key}.jsonl'), item_depth=1)
+    assert counts == {'a': 1}
+    assert json.loads((tmp_path / 'a.jsonl').read_text()) == {
+        '@customer': 'a', 'n': '1'}
+
+
+def test_partition_rejects_paths(tmp_path):
+    with pytest.raises(ValueError):
+        partition('<a><b k="../x"/></a>', '@k', str(tmp_path / '{key}'))
+    with pytest.raises(ValueError):
+        partition('<a><b/></a>', '@k', str(tmp_path / '{key}'),
+                  format='csv')
+
+
+def test_find_all():
+    xml = ('<a><b x="1">1</b><c><b>2</b></c><b><d>3</d><d>4</d></b>'
+           '<!-- c --><b/></a>')
+    assert list(find_all(xml, 'a/b')) == [
+        {'@x': '1', '#text': '1'}, {'d': ['3', '4']}, None]
+    assert list(find_all(xml.encode(), ['a', 'c', 'b'])) == ['2']
+    assert list(find_all(BytesIO(xml.encode()), '/a/b/d/',
+                         chunk_size=4)) == ['3', '4']
+    assert list(find_all('<a><b> <d>3</d> </b><b> t </b></a>', 'a/b',
+                         force_list=('d',), force_cdata=True)) == [
+        {'d': [{'#text': '3'}]}, {'#text': 't'}]
+    assert list(find_all((c for c in xml), 'a/b/d')) == ['3', '4']
+    assert list(find_all(xml, 'a/x')) == []
+    xml = '<a xmlns="urn:x"><b>1</b></a>'
+    assert list(find_all(xml, 'x:a/x:b', process_namespaces=True,
+                         namespaces={'urn:x': 'x'})) == ['1']
+    with pytest.raises(ValueError):
+        list(find_all(xml, []))
+
+
+def test_find_first_stops_early():
+    class Reader(BytesIO):
+        consumed = 0
+
+        def read(self, size=-1):
+            data = super().read(size)
+            self.consumed += len(data)
+            return data
+
+    xml = (b'<feed><header><id>7</id></header>' +
+           b'<item>x</item>' * 10000 + b'<broken')
+    reader = Reader(xml)
+    assert find_first(reader, 'feed/header', chunk_size=1024) == {'id': '7'}
+    assert reader.consumed == 1024
+    assert find_first(xml, 'feed/item') == 'x'
+    with pytest.raises(expat.ExpatError):
+        find_first(xml, 'feed/none')
+    assert find_first(b'<a><b/></a>', 'a/c', default=0) == 0
+    assert list(find_all(StringIO('<a><b>1</b><b>2</b></a>'), 'a/b',
+                         chunk_size=4)) == ['1', '2']
+    xml = b'<a>' + b'<b>1</b>' * 100 + b'</a>'
+    assert len(list(find_all(xml, 'a/b', max_bytes=len(xml)))) == 100
+    with pytest.raises(LimitExceeded):
+        list(find_all(BytesIO(xml), 'a/b', chunk_size=16, max_bytes=100))
+    assert find_first(xml, 'a/b', chunk_size=16, max_bytes=100) == '1'
+
+
+def test_xml_to_json_document():
+    xml = '<a x="1"><b>1</b><c/><b>2</b></a>'
+    assert json.loads(xml_to_json(xml)) == parse(xml)
+    assert xml_to_json(xml, attr_prefix='', json_options={'indent': 1}) == (
+        json.dumps(parse(xml, attr_prefix=''), indent=1))
+
+
+@pytest.mark.parametrize('xml', [
+    '<a/>', '<a>t</a>', '<a x="1">t</a>', '<a b="0"><b>1</b>x<b/>y</a>',
+    '<a><!--c--><b><c>1</c><c>2</c></b><!--d--><b/></a>',
+])
+@pytest.mark.parametrize('options', [
+    {}, {'attr_prefix': ''}, {'force_list': ('b',)}, {'force_cdata': True},
+    {'process_comments': True, 'dict_constructor': collections.OrderedDict},
+    {'postprocessor': lambda path, key, value: (
+        None if key == 'c' else (key.upper(), value))},
+])
+def test_xml_to_json_matches_parse(xml, options):
+    assert xml_to_json(xml, **options) == json.dumps(parse(xml, **options))
+    assert xml_to_json(xml, json_options={'separators': (',', ':')},
+                       **options) == json.dumps(parse(xml, **options),
+                                                separators=(',', ':'))
+
+
+def test_xml_to_json_lines():
+    xml = '<a><b y="2"><c>1</c></b><b>t</b><b/></a>'
+    output = StringIO()
+    assert xml_to_json(xml, output, item_depth=2) is None
+    assert output.getvalue() == '{"@y": "2", "c": "1"}\n"t"\nnull\n'
+    assert json.loads(xml_to_json(xml, item_depth=2, lines=False)) == [
+        {'@y': '2', 'c': '1'}, 't', None]
+    assert xml_to_json('<a/>', item_depth=2, lines=False) == '[]'
+
+
+def test_follow_growing_file(tmp_path):
+    log = tmp_path / 'log.xml'
+    state = tmp_path / 'log.state'
+    log.write_bytes(b'<?xml version="1.0"?>\n<log><e n="1"><v>a</v></e><e>b</e><e')
+    items = follow(str(log), state_file=str(state), poll_interval=0.001,
+                   idle_timeout=0.05)
+    assert next(items) == {'@n': '1', 'v': 'a'}
+    assert next(items) == 'b'
+    with open(log, 'ab') as f:
+        f.write(b'>c</e>')
+    assert next(items) == 'c'
+    assert list(items) == []
+    assert json.loads(state.read_text())[0] == log.stat().st_size
+
+    with open(log, 'ab') as f:
+        f.write(b'<e>d</e><e>e</e>')
+    items = follow(str(log), state_file=str(state), poll_interval=0.001,
+                   idle_timeout=0.01)
+    assert next(items) == 'd'
+    assert next(items) == 'e'
+    items.close()
+    assert list(follow(str(log), state_file=str(state), idle_timeout=0)) == [
+        'e']
+
+    with open(log, 'ab') as f:
+        f.write(b'<e>f</e></log>')
+    assert list(follow(str(log), state_file=str(state))) == ['f']
+
+
+def test_follow_without_state(tmp_path):
+    log = tmp_path / 'log.xml'
+    log.write_bytes(b'<log><e>1</e><e>2</e>')
+    assert list(follow(str(log), idle_timeout=0)) == ['1', '2']
+    assert list(follow(str(log), item_depth=1, idle_timeout=0)) == []
+    log.write_bytes(b'<log><e>1</e></log>')
+    assert list(follow(str(log), chunk_size=3)) == ['1']
+    with pytest.raises(ValueError):
+        next(follow(str(log), item_depth=0))
+    with pytest.raises(ValueError):
+        next(follow(str(log), item_depth=1, state_file=str(tmp_path / 's')))
+
+
+def test_follow_consumer_failure_keeps_item(tmp_path):
+    log = tmp_path / 'log.xml'
+    state = tmp_path / 'log.state'
+    log.write_bytes(b'<log><e>1</e><e>2</e><e>3</e>')
+    with pytest.raises(RuntimeError):
+        for item in follow(str(log), state_file=str(state), idle_timeout=0):
+            if item == '2':
+                raise RuntimeError(item)
+    assert list(follow(str(log), state_file=str(state), idle_timeout=0)) == [
+        '2', '3']
@@ -2,16 +2,239 @@
 "Makes working with XML feel like you are working with JSON"
 
 from xml.parsers import expat
-from xml.sax.saxutils import XMLGenerator, escape
+from xml.sax.saxutils import XMLGenerator, escape, quoteattr
 from xml.sax.xmlreader import AttributesImpl
-from io import StringIO
+from io import BufferedIOBase, BytesIO, StringIO, TextIOWrapper
 from inspect import isgenerator
+from itertools import islice
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
 import codecs
+import hashlib
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
 
 class ParsingInterrupted(Exception):
     pass
 
 
+class LimitExceeded(ValueError):
+    """Raised when the input exceeds one of the `max_*` limits of `parse`."""
+
+
+class Checkpoint(namedtuple('Checkpoint', ('offset', 'ancestors'))):
+    """Position in the input right after an item emitted in streaming mode.
+
+    `offset` is the byte offset just past the item's end tag, and `ancestors`
+    holds the byte offsets of the start tags of the elements enclosing it,
+    outermost first. Both are plain integers, so a checkpoint can be stored
+    (e.g. as JSON) and later passed to ``parse(..., resume_from=checkpoint)``.
+    """
+    __slots__ = ()
+
+
+class CompactNode(MutableMapping):
+    """Compact mapping for ``parse(..., dict_constructor=CompactNode)``.
+
+    A node stores its values in a tuple next to a tuple of keys that is shared
+    by all nodes with the same keys in the same order, so it takes a fraction
+    of the memory of a `dict`, at the price of slower updates and of lookups
+    that scan the keys. It is meant for holding many small, parsed elements
+    that are mostly read afterwards.
+
+    Nodes support the usual mapping API, preserve insertion order and compare
+    equal to dicts with the same items. :meth:`to_dict` converts a tree of
+    nodes back to plain dicts.
+    """
+    __slots__ = ('_keys', '_values')
+
+    # Shared key tuples, including the prefixes a node goes through while it
+    # is built. The cache has two generations of up to `_max_shapes` each:
+    # when the current one is full it becomes the old one, and shapes still
+    # in use are moved back from it as they are looked up, so that a process
+    # parsing varied documents keeps sharing the shapes of recent ones.
+    _shapes = {}
+    _old_shapes = {}
+    _max_shapes = 10000
+
+    def __init__(self, items=()):
+        if not items:
+            self._keys = self._values = ()
+            return
+        if not isinstance(items, dict):
+            items = dict(items)
+        self._keys = self._shape(tuple(items))
+        self._values = tuple(items.values())
+
+    @classmethod
+    def _shape(cls, keys):
+        # The cache is kept on CompactNode itself, also for subclasses.
+        shape = CompactNode._shapes.get(keys)
+        if shape is None:
+            shape = CompactNode._old_shapes.get(keys, keys)
+            if len(CompactNode._shapes) >= cls._max_shapes:
+                CompactNode._old_shapes = CompactNode._shapes
+                CompactNode._shapes = {}
+            CompactNode._shapes[keys] = shape
+        return shape
+
+    def __getitem__(self, key):
+        keys = self._keys
+        if key in keys:
+            return self._values[keys.index(key)]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            index = self._keys.index(key)
+        except ValueError:
+            self._keys = self._shape(self._keys + (key,))
+            self._values += (value,)
+        else:
+            values = self._values
+            self._values = values[:index] + (value,) + values[index + 1:]
+
+    def __delitem__(self, key):
+        try:
+            index = self._keys.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+        keys, values = self._keys, self._values
+        self._keys = self._shape(keys[:index] + keys[index + 1:])
+        self._values = values[:index] + values[index + 1:]
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({list(zip(self._keys, self._values))!r})'
+
+    def __getstate__(self):
+        return self._keys, self._values
+
+    def __setstate__(self, state):
+        keys, self._values = state
+        self._keys = self._shape(keys)
+
+    def to_dict(self):
+        """Return a copy of this node as a `dict`, recursively converting
+        nested nodes, including those inside lists."""
+        return {key: _compact_to_dict(value)
+                for key, value in zip(self._keys, self._values)}
+
+
+def _compact_to_dict(value):
+    if isinstance(value, CompactNode):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_compact_to_dict(item) for item in value]
+    return value
+
+
+class Path:
+    """Immutable path from the root to an element, passed to callbacks when
+    parsing with ``immutable_path=True``.
+
+    It behaves like the default list of ``(name, attrs)`` pairs (``len``,
+    indexing, iteration, comparison with lists and tuples), but extending it
+    creates a child that links to its parent instead of copying it. Handing
+    it out and keeping it is therefore free: ``path[:-1]`` returns the parent
+    path, and ``path.names`` is a tuple of the element names, computed once.
+    Paths are hashable by their names, e.g. to count items per path.
+    """
+    __slots__ = ('parent', 'name', 'attrs', '_len', '_names')
+
+    def __init__(self, parent=None, name=None, attrs=None):
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self._len = 0 if parent is None else parent._len + 1
+        self._names = None if parent is not None else ()
+
+    def child(self, name, attrs=None):
+        """Return the path of a child element of this one."""
+        return Path(self, name, attrs)
+
+    @property
+    def names(self):
+        names = self._names
+        if names is None:
+            names = self._names = self.parent.names + (self.name,)
+        return names
+
+    def ancestor(self, length):
+        """Return the prefix of this path with `length` elements."""
+        if not 0 <= length <= self._len:
+            raise IndexError('path index out of range')
+        path = self
+        for _ in range(self._len - length):
+            path = path.parent
+        return path
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if start == 0 and step == 1:
+                return self.ancestor(max(stop, 0))
+            return tuple(self)[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('path index out of range')
+        path = self.ancestor(index + 1)
+        return path.name, path.attrs
+
+    def __iter__(self):
+        entries = []
+        path = self
+        while path.parent is not None:
+            entries.append((path.name, path.attrs))
+            path = path.parent
+        return reversed(entries)
+
+    def __eq__(self, other):
+        if isinstance(other, Path):
+            if self._len != other._len or self.names != other.names:
+                return False
+        elif not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(self.names)
+
+    def __repr__(self):
+        return f'Path({list(self)!r})'
+
+
+# Types that unparse treats as mappings rather than as sequences.
+_MAPPING_TYPES = (dict, CompactNode)
+_NON_SEQUENCE_TYPES = (str, bytes, bytearray, memoryview) + _MAPPING_TYPES
+
+# Values longer than this are never interned by `intern_values`.
+_INTERN_MAX_LENGTH = 64
+# Default number of distinct strings kept by `intern_values=True`.
+_INTERN_MAX_ENTRIES = 100000
+
+_START_TAG_RE = re.compile(rb'<[^"\'>]*(?:(?:"[^"]*"|\'[^\']*\')[^"\'>]*)*>')
+
+
 class _DictSAXHandler:
     def __init__(
         self,
@@ -29,10 +252,29 @@ class _DictSAXHandler:
         namespaces=None,
         force_list=None,
         comment_key="#comment",
+        checkpoints=False,
+        max_depth=None,
+        max_elements=None,
+        max_text_length=None,
+        max_attributes=None,
+        intern_values=False,
+        immutable_path=False,
+        path_attribs=True,
+        sample_every=None,
+        sample_fraction=None,
+        sample_size=None,
+        sample_seed=None,
     ):
-        self.path = []
+        self.path = Path() if immutable_path else []
+        self.immutable_path = immutable_path
+        # Attributes in the path are only seen by callbacks: skip them if
+        # none of those that receive the path is set.
+        self.path_attribs = path_attribs and bool(
+            item_depth or postprocessor or callable(force_list)
+            or callable(force_cdata))
         self.stack = []
         self.data = []
+        self.text_length = 0
         self.item = None
         self.item_depth = item_depth
         self.xml_attribs = xml_attribs
@@ -44,11 +286,53 @@ class _DictSAXHandler:
         self.postprocessor = postprocessor
         self.dict_constructor = dict_constructor
         self.strip_whitespace = strip_whitespace
+        self.skip_whitespace = strip_whitespace and not cdata_separator.strip()
         self.namespace_separator = namespace_separator
         self.namespaces = namespaces
         self.namespace_declarations = dict_constructor()
         self.force_list = force_list
         self.comment_key = comment_key
+        self.checkpoints = checkpoints
+        self.max_depth = max_depth
+        self.max_elements = max_elements
+        self.max_text_length = max_text_length
+        self.max_attributes = max_attributes
+        self.limits = (max_depth, max_elements, max_attributes) != (None,) * 3
+        self.element_count = 0
+        self.parser = None
+        self.offsets = []
+        self.item_start = None
+        self.self_closing = False
+        self.offset_map = [(0, 0)]
+        if intern_values is True:
+            intern_values = _INTERN_MAX_ENTRIES
+        self.interned = {} if intern_values else None
+        self.intern_limit = intern_values
+        self.sampling = (sample_every, sample_fraction,
+                         sample_size) != (None,) * 3
+        if self.sampling:
+            if not item_depth:
+                raise ValueError(
+                    "sampling requires streaming mode (item_depth)")
+            if sample_every is not None and sample_every < 1:
+                raise ValueError("sample_every must be at least 1")
+            if sample_fraction is not None and not 0 <= sample_fraction <= 1:
+                raise ValueError("sample_fraction must be between 0 and 1")
+            if sample_size is not None and sample_size < 0:
+                raise ValueError("sample_size must not be negative")
+        self.sample_every = sample_every
+        self.sample_fraction = sample_fraction
+        self.sample_size = sample_size
+        # Seeding a generator reads os.urandom: only do it when it is used.
+        self.random = (random.Random(sample_seed)
+                       if sample_fraction is not None or sample_size is not None
+                       else None)
+        self.item_index = 0
+        self.sample_slot = None
+        self.reservoir = [] if sample_size is not None else None
+        self.sample_seen = 0
+        self.skip_depth = 0
+        self.saved_handlers = None
 
     def _build_name(self, full_name):
         if self.namespaces is None:
@@ -71,36 +355,90 @@ class _DictSAXHandler:
             return attrs
         return self.dict_constructor(zip(attrs[0::2], attrs[1::2]))
 
+    def _intern(self, value, key=False):
+        # Share one str object between equal keys and short values, up to
+        # `intern_limit` distinct strings per parse.
+        if not key and len(value) > _INTERN_MAX_LENGTH:
+            return value
+        if len(self.interned) < self.intern_limit:
+            return self.interned.setdefault(value, value)
+        return self.interned.get(value, value)
+
     def startNamespaceDecl(self, prefix, uri):
         self.namespace_declarations[prefix or ''] = uri
 
     def startElement(self, full_name, attrs):
+        if self.limits:
+            self._check_limits(attrs)
+        if (self.sampling and len(self.path) == self.item_depth - 1
+                and not self._sample()):
+            self._start_skipping()
+            return
         name = self._build_name(full_name)
-        attrs = self._attrs_to_dict(attrs)
-        if self.namespace_declarations:
-            if not attrs:
-                attrs = self.dict_constructor()
-            attrs['xmlns'] = self.namespace_declarations
+        declarations = self.namespace_declarations
+        if declarations:
             self.namespace_declarations = self.dict_constructor()
-        self.path.append((name, attrs or None))
+        path_attrs = None
+        if self.path_attribs and (attrs or declarations):
+            path_attrs = self._attrs_to_dict(attrs)
+            if declarations:
+                if not path_attrs:
+                    path_attrs = self.dict_constructor()
+                path_attrs['xmlns'] = declarations
+        if self.immutable_path:
+            self.path = Path(self.path, name, path_attrs)
+        else:
+            self.path.append((name, path_attrs))
+        if self.checkpoints:
+            if len(self.path) < self.item_depth:
+                self.offsets.append(self._byte_index())
+            elif len(self.path) == self.item_depth:
+                self.item_start = self._byte_index()
+                tag = _START_TAG_RE.match(self.parser.GetInputContext())
+                self.self_closing = tag.group().endswith(b'/>')
         if len(self.path) >= self.item_depth:
-            self.stack.append((self.item, self.data))
-            if self.xml_attribs:
-                attr_entries = []
-                for key, value in attrs.items():
-                    key = self.attr_prefix+self._build_name(key)
-                    if self.postprocessor:
-                        entry = self.postprocessor(self.path, key, value)
-                    else:
-                        entry = (key, value)
-                    if entry:
-                        attr_entries.append(entry)
-                attrs = self.dict_constructor(attr_entries)
+            self.stack.append((self.item, self.data, self.text_length))
+            if self.xml_attribs and (attrs or declarations):
+                self.item = self._attrs_to_item(attrs, declarations) or None
             else:
-                attrs = None
-            self.item = attrs or None
+                self.item = None
             self.data = []
 
+    def _attrs_to_item(self, attrs, declarations):
+        # Build the item's mapping straight from expat's flat list of names
+        # and values, without an intermediate dict of the raw attributes.
+        if isinstance(attrs, dict):
+            attrs = [entry for pair in attrs.items() for entry in pair]
+        prefix = self.attr_prefix
+        if (self.namespaces is None and self.interned is None
+                and self.postprocessor is None):
+            item = self.dict_constructor(
+                zip(map(prefix.__add__, attrs[0::2]), attrs[1::2]))
+            if declarations:
+                item[prefix + 'xmlns'] = declarations
+            return item
+        entries = []
+        for key, value in zip(attrs[0::2], attrs[1::2]):
+            key = prefix + self._build_name(key)
+            if self.interned is not None:
+                key = self._intern(key, True)
+                value = self._intern(value)
+            if self.postprocessor:
+                entry = self.postprocessor(self.path, key, value)
+                if entry:
+                    entries.append(entry)
+            else:
+                entries.append((key, value))
+        if declarations:
+            key = prefix + 'xmlns'
+            if self.postprocessor:
+                entry = self.postprocessor(self.path, key, declarations)
+                if entry:
+                    entries.append(entry)
+            else:
+                entries.append((key, declarations))
+        return self.dict_constructor(entries)
+
     def endElement(self, full_name):
         name = self._build_name(full_name)
         # If we just closed an item at the streaming depth, emit it and drop it
@@ -112,25 +450,36 @@ class _DictSAXHandler:
                 item = (None if not self.data
                         else self.cdata_separator.join(self.data))
 
-            should_continue = self.item_callback(self.path, item)
-            if not should_continue:
+            args = (self.path, item)
+            if self.checkpoints:
+                args += (self._checkpoint(),)
+            if self.reservoir is not None:
+                self._keep_sample(args)
+            elif not self.item_callback(*args):
                 raise ParsingInterrupted
             # Reset state for the parent context without keeping a reference to
             # the emitted item.
             if self.stack:
-                self.item, self.data = self.stack.pop()
+                self.item, self.data, self.text_length = self.stack.pop()
             else:
                 self.item = None
                 self.data = []
-            self.path.pop()
+            if self.immutable_path:
+                self.path = self.path.parent
+            else:
+                self.path.pop()
             return
         if self.stack:
             data = (None if not self.data
                     else self.cdata_separator.join(self.data))
             item = self.item
-            self.item, self.data = self.stack.pop()
+            self.item, self.data, self.text_length = self.stack.pop()
             if self.strip_whitespace and data:
                 data = data.strip() or None
+            if self.interned is not None:
+                name = self._intern(name, True)
+                if data:
+                    data = self._intern(data)
             if data and self._should_force_cdata(name, data) and item is None:
                 item = self.dict_constructor()
             if item is not None:
@@ -142,13 +491,29 @@ class _DictSAXHandler:
         else:
             self.item = None
             self.data = []
-        self.path.pop()
+        if self.checkpoints and len(self.path) < self.item_depth:
+            self.offsets.pop()
+        if self.immutable_path:
+            self.path = self.path.parent
+        else:
+            self.path.pop()
 
     def characters(self, data):
         if not self.data:
+            # Leading whitespace, such as the indentation before the first child
+            # element, would be stripped anyway: drop it before buffering it.
+            if (self.skip_whitespace and data.isspace()
+                    and len(self.path) != self.item_depth):
+                return
             self.data = [data]
+            self.text_length = len(data)
         else:
             self.data.append(data)
+            self.text_length += len(data)
+        if self.max_text_length is not None:
+            if self.text_length > self.max_text_length:
+                raise LimitExceeded(
+                    f"text longer than {self.max_text_length} characters")
 
     def comments(self, data):
         if self.strip_whitespace:
@@ -176,6 +541,106 @@ class _DictSAXHandler:
                 item[key] = data
         return item
 
+    def _sample(self):
+        # Decide whether the item that starts now is kept.
+        index = self.item_index
+        self.item_index += 1
+        if self.sample_every is not None and index % self.sample_every:
+            return False
+        if (self.sample_fraction is not None
+                and self.random.random() >= self.sample_fraction):
+            return False
+        if self.sample_size is not None:
+            # Reservoir sampling (algorithm R) over the remaining items.
+            seen = self.sample_slot = self.sample_seen
+            self.sample_seen += 1
+            if seen >= self.sample_size:
+                slot = self.random.randrange(seen + 1)
+                if slot >= self.sample_size:
+                    return False
+                self.sample_slot = slot
+        return True
+
+    def _keep_sample(self, args):
+        path, item = args[:2]
+        if not self.immutable_path:
+            path = list(path)
+        entry = (self.item_index - 1, (path, item) + args[2:])
+        if self.sample_slot < len(self.reservoir):
+            self.reservoir[self.sample_slot] = entry
+        else:
+            self.reservoir.append(entry)
+
+    def deliver_samples(self):
+        """Pass the items kept by `sample_size` to `item_callback`, in
+        document order, once the whole input has been read."""
+        if self.reservoir is None:
+            return
+        for _, args in sorted(self.reservoir, key=lambda entry: entry[0]):
+            if not self.item_callback(*args):
+                raise ParsingInterrupted
+
+    def _start_skipping(self):
+        # Consume an item that is not sampled with bare expat handlers that
+        # only track the nesting, without building anything for it.
+        parser = self.parser
+        self.namespace_declarations = self.dict_constructor()
+        self.skip_depth = 1
+        self.saved_handlers = (
+            parser.StartElementHandler, parser.EndElementHandler,
+            parser.CharacterDataHandler, parser.CommentHandler,
+            parser.StartNamespaceDeclHandler)
+        parser.StartElementHandler = self._skip_start
+        parser.EndElementHandler = self._skip_end
+        parser.CharacterDataHandler = None
+        parser.CommentHandler = None
+        parser.StartNamespaceDeclHandler = None
+
+    def _skip_start(self, name, attrs):
+        if self.limits:
+            self._check_limits(attrs, len(self.path) + self.skip_depth)
+        self.skip_depth += 1
+
+    def _skip_end(self, name):
+        self.skip_depth -= 1
+        if not self.skip_depth:
+            parser = self.parser
+            (parser.StartElementHandler, parser.EndElementHandler,
+             parser.CharacterDataHandler, parser.CommentHandler,
+             parser.StartNamespaceDeclHandler) = self.saved_handlers
+
+    def _check_limits(self, attrs, depth=None):
+        self.element_count += 1
+        if (self.max_elements is not None
+                and self.element_count > self.max_elements):
+            raise LimitExceeded(f"more than {self.max_elements} elements")
+        if depth is None:
+            depth = len(self.path)
+        if self.max_depth is not None and depth >= self.max_depth:
+            raise LimitExceeded(f"elements nested deeper than {self.max_depth}")
+        if self.max_attributes is not None:
+            count = len(attrs) if isinstance(attrs, dict) else len(attrs) // 2
+            if count > self.max_attributes:
+                raise LimitExceeded(
+                    f"element with more than {self.max_attributes} attributes")
+
+    def _byte_index(self, index=None):
+        if index is None:
+            index = self.parser.CurrentByteIndex
+        # Map a position in the data fed to expat back to the original input,
+        # which differs from it when resuming from a checkpoint.
+        fed, original = self.offset_map[
+            bisect_right(self.offset_map, (index, float('inf'))) - 1]
+        return original + index - fed
+
+    def _checkpoint(self):
+        index = self.parser.CurrentByteIndex
+        # expat reports the end of `<a>...</a>` at the start of `</a>`, but the
+        # end of `<a/>` right after it.
+        if not self.self_closing:
+            index += self.parser.GetInputContext().index(b'>') + 1
+        return Checkpoint(self._byte_index(index), tuple(self.offsets))
+
     def _should_force_list(self, key, value):
         if not self.force_list:
             return False
@@ -184,7 +649,9 @@ class _DictSAXHandler:
         try:
             return key in self.force_list
         except TypeError:
-            return self.force_list(self.path[:-1], key, value)
+            parent = (self.path.parent if self.immutable_path
+                      else self.path[:-1])
+            return self.force_list(parent, key, value)
 
     def _should_force_cdata(self, key, value):
         if not self.force_cdata:
@@ -194,11 +661,14 @@ class _DictSAXHandler:
         try:
             return key in self.force_cdata
         except TypeError:
-            return self.force_cdata(self.path[:-1], key, value)
+            parent = (self.path.parent if self.immutable_path
+                      else self.path[:-1])
+            return self.force_cdata(parent, key, value)
 
 
 def parse(xml_input, encoding=None, expat=expat, process_namespaces=False,
-          namespace_separator=':', disable_entities=True, process_comments=False, **kwargs):
+          namespace_separator=':', disable_entities=True, process_comments=False,
+          checkpoints=False, resume_from=None, max_bytes=None, **kwargs):
     """Parse the given XML input and convert it into a dictionary.
 
     `xml_input` can either be a `string`, a file-like object, or a generator of strings.
@@ -334,12 +804,90 @@ def parse(xml_input, encoding=None, expat=expat, process_namespaces=False,
         at the default `True`, comments will have leading and trailing
         whitespace removed. Disable `strip_whitespace` to keep comment
         indentation or padding intact.
+
+    In streaming mode, `checkpoints=True` passes a third argument to
+    `item_callback`: a :class:`Checkpoint` recording where the item ended in
+    the (binary) input. If a long import dies, pass the last checkpoint that
+    was fully processed as `resume_from` together with the same seekable input
+    to continue with the item that follows it, without re-reading anything
+    before it. Only the prolog and the start tags of the enclosing elements
+    are read again, so `path` and namespaces are reported as before::
+
+        >>> def handle(path, item, checkpoint):
+        ...     save(checkpoint)
+        ...     return True
+        >>> xmltodict.parse(open('dump.xml', 'rb'), item_depth=2,
+        ...                 item_callback=handle, checkpoints=True,
+        ...                 resume_from=load())
+
+    To look at a sample of the items of a large document, set
+    `sample_every=n` to keep every n-th item, `sample_fraction=p` to keep
+    each item with probability `p`, or `sample_size=k` to keep a uniform
+    random sample of `k` items (reservoir sampling). They can be combined
+    and are applied in that order. `sample_seed` seeds the random choices.
+    Items that are not kept are skipped by bare expat handlers that build
+    nothing, so sampling runs close to raw scanning speed. With
+    `sample_size`, the kept items are passed to `item_callback` in document
+    order after the whole input has been read.
+
+    To bound the resources spent on untrusted input, set any of `max_depth`,
+    `max_elements`, `max_attributes` (per element), `max_text_length` (per
+    element, in characters) and `max_bytes` (total input size). Exceeding one
+    raises :class:`LimitExceeded`, a subclass of `ValueError`, as soon as it is
+    detected. The checks are skipped entirely for limits left at `None`.
+
+    Callbacks (`item_callback`, `postprocessor`, `force_list` and
+    `force_cdata`) receive the current path as a list of ``(name, attrs)``
+    pairs that is updated in place, so it must be copied to be kept. With
+    `immutable_path=True` they get a :class:`Path` instead, which can be
+    kept as is and costs nothing to extend or shorten. With
+    `path_attribs=False`, the attributes of the elements are left out of the
+    path (every `attrs` is `None`).
+
+    Large documents often repeat the same short values (currency codes,
+    flags, status names) many times, each becoming a separate string. With
+    `intern_values=True`, keys and text or attribute values of up to 64
+    characters are looked up in a table kept for the duration of the parse,
+    so equal values share a single object. An integer caps the number of
+    distinct strings in the table (the default is 100000); values seen after
+    it is full are kept as they are.
     """
-    handler = _DictSAXHandler(namespace_separator=namespace_separator,
-                              **kwargs)
+    return _parse(_DictSAXHandler, xml_input, encoding, expat,
+                  process_namespaces, namespace_separator, disable_entities,
+                  process_comments, checkpoints, resume_from, max_bytes,
+                  **kwargs).item
+
+
+def _parse(handler_class, xml_input, encoding=None, expat=expat,
+           process_namespaces=False, namespace_separator=':',
+           disable_entities=True, process_comments=False, checkpoints=False,
+           resume_from=None, max_bytes=None, **kwargs):
     if isinstance(xml_input, str):
         encoding = encoding or 'utf-8'
         xml_input = xml_input.encode(encoding)
+    handler, parser = _make_parser(
+        handler_class, encoding, expat, process_namespaces,
+        namespace_separator, disable_entities, process_comments,
+        checkpoints=checkpoints, **kwargs)
+    if resume_from is not None:
+        xml_input = _resume(parser, handler, xml_input, resume_from)
+    elif checkpoints:
+        # Let expat read the input in small blocks: the input context used to
+        # locate the end of each item spans the rest of the current block.
+        if isinstance(xml_input, (bytes, bytearray)):
+            xml_input = BytesIO(xml_input)
+        elif isgenerator(xml_input):
+            xml_input = _small_blocks(xml_input)
+    _feed(parser, xml_input, max_bytes)
+    handler.deliver_samples()
+    return handler
+
+
+def _make_parser(handler_class, encoding=None, expat=expat,
+                 process_namespaces=False, namespace_separator=':',
+                 disable_entities=True, process_comments=False, **kwargs):
+    handler = handler_class(namespace_separator=namespace_separator,
+                            **kwargs)
     if not process_namespaces:
         namespace_separator = None
     parser = expat.ParserCreate(
@@ -359,6 +907,13 @@ def parse(xml_input, encoding=None, expat=expat, process_namespaces=False,
             raise ValueError("entities are disabled")
 
         parser.EntityDeclHandler = _forbid_entities
+    handler.parser = parser
+    return handler, parser
+
+
+def _feed(parser, xml_input, max_bytes=None):
+    if max_bytes is not None:
+        xml_input = _limit_input(xml_input, max_bytes)
     if hasattr(xml_input, 'read'):
         parser.ParseFile(xml_input)
     elif isgenerator(xml_input):
@@ -367,7 +922,1389 @@ def parse(xml_input, encoding=None, expat=expat, process_namespaces=False,
         parser.Parse(b'', True)
     else:
         parser.Parse(xml_input, True)
-    return handler.item
+
+
+def _small_blocks(chunks, size=2048):
+    # Split large chunks into blocks of the size expat's ParseFile reads.
+    for chunk in chunks:
+        if len(chunk) <= size:
+            yield chunk
+            continue
+        for start in range(0, len(chunk), size):
+            yield chunk[start:start + size]
+
+
+class _LimitedReader:
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.remaining = max_bytes
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise LimitExceeded("input larger than max_bytes")
+        return data
+
+
+def _limited_chunks(chunks, max_bytes):
+    for chunk in chunks:
+        max_bytes -= len(chunk)
+        if max_bytes < 0:
+            raise LimitExceeded("input larger than max_bytes")
+        yield chunk
+
+
+def _limit_input(xml_input, max_bytes):
+    if hasattr(xml_input, 'read'):
+        return _LimitedReader(xml_input, max_bytes)
+    if isgenerator(xml_input):
+        return _limited_chunks(xml_input, max_bytes)
+    if len(xml_input) > max_bytes:
+        raise LimitExceeded("input larger than max_bytes")
+    return xml_input
+
+
+def _read_start_tag(stream, chunk_size=1024):
+    data = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError("checkpoint does not match the input")
+        data += chunk
+        match = _START_TAG_RE.match(data)
+        if match:
+            return match.group()
+
+
+def _replay_prefix(stream, ancestors):
+    """Read the prolog and the start tags at `ancestors` from `stream`.
+
+    Returns `(offset, data)` pairs telling where each piece is in `stream`.
+    """
+    if not ancestors:
+        raise ValueError("cannot resume outside of the root element")
+    stream.seek(0)
+    pieces = [(0, stream.read(ancestors[0]))]
+    for start in ancestors:
+        stream.seek(start)
+        pieces.append((start, _read_start_tag(stream)))
+    return pieces
+
+
+def _resume(parser, handler, xml_input, checkpoint):
+    offset, ancestors = checkpoint
+    if isinstance(xml_input, (bytes, bytearray)):
+        xml_input = BytesIO(xml_input)
+    elif not hasattr(xml_input, 'seek'):
+        raise ValueError("resume_from requires a seekable input")
+    # Replay the prolog and the start tags of the enclosing elements, then
+    # continue right after the checkpoint.
+    handler.offset_map = []
+    fed = 0
+    for start, data in _replay_prefix(xml_input, ancestors):
+        handler.offset_map.append((fed, start))
+        parser.Parse(data, False)
+        fed += len(data)
+    handler.offset_map.append((fed, offset))
+    xml_input.seek(offset)
+    return xml_input
+
+
+class RecordIndex:
+    """Byte ranges of the items of an XML file, as built by
+    :func:`build_index`.
+
+    Records are kept in document order as `(start, end, ancestors)` tuples,
+    where `ancestors` is a position in the shared `ancestors` table. If the
+    index was built with a `key`, `keys` holds the key of each record.
+    """
+
+    def __init__(self, source, item_depth, records, ancestors, keys=None,
+                 size=None, mtime=None):
+        self.source = source
+        self.item_depth = item_depth
+        self.records = records
+        self.ancestors = ancestors
+        self.keys = keys
+        self.size = size
+        self.mtime = mtime
+        self._positions = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def locate(self, key):
+        """Return `(start, end, ancestors)` for `key`.
+
+        Unkeyed indexes are looked up by record position. If several records
+        share a key, the first one wins.
+        """
+        if self.keys is None:
+            position = key
+        else:
+            if self._positions is None:
+                self._positions = {}
+                for position, record_key in enumerate(self.keys):
+                    self._positions.setdefault(record_key, position)
+            position = self._positions[key]
+        start, end, ancestors = self.records[position]
+        return start, end, tuple(self.ancestors[ancestors])
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': 1,
+                'source': self.source,
+                'size': self.size,
+                'mtime': self.mtime,
+                'item_depth': self.item_depth,
+                'ancestors': self.ancestors,
+                'records': self.records,
+                'keys': self.keys,
+            }, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != 1:
+            raise ValueError("unsupported index format")
+        return cls(data['source'], data['item_depth'], data['records'],
+                   data['ancestors'], data['keys'], data['size'],
+                   data['mtime'])
+
+
+def _record_key(key, path, item, cdata_key='#text'):
+    if callable(key):
+        value = key(path, item)
+    else:
+        try:
+            value = item[key]
+        except (KeyError, TypeError):
+            return None
+        # A key element with attributes is parsed into a mapping: use its
+        # text.
+        if isinstance(value, _MAPPING_TYPES):
+            value = value.get(cdata_key)
+    if value is not None and not isinstance(value, (str, int, float)):
+        raise ValueError(
+            f"record key must be a string or a number, got {value!r}")
+    return value
+
+
+def build_index(source, index_path=None, item_depth=2, key=None, **kwargs):
+    """Scan the XML file at `source` once and index the byte range of every
+    item found at `item_depth`.
+
+    If `key` is given, records can be fetched by the value of that child
+    element or attribute (e.g. `'id'` or `'@id'`) of each item, or by the
+    return value of a `key(path, item)` callable. Otherwise they are fetched
+    by position. The index is saved to `index_path` if given, and returned as
+    a :class:`RecordIndex`. Other keyword arguments are passed to the parser.
+    """
+    if item_depth < 2:
+        raise ValueError("item_depth must be at least 2")
+    records = []
+    keys = [] if key is not None else None
+    ancestors = {}
+
+    def collect(path, item, checkpoint):
+        position = ancestors.setdefault(checkpoint.ancestors, len(ancestors))
+        records.append((handler.item_start, checkpoint.offset, position))
+        if keys is not None:
+            keys.append(_record_key(key, path, item, cdata_key))
+        return True
+
+    cdata_key = kwargs.get('cdata_key', '#text')
+    with open(source, 'rb') as stream:
+        handler, parser = _make_parser(
+            _DictSAXHandler, item_depth=item_depth, item_callback=collect,
+            checkpoints=True, **kwargs)
+        _feed(parser, stream)
+        stat = os.fstat(stream.fileno())
+    index = RecordIndex(os.path.abspath(source), item_depth, records,
+                        list(ancestors), keys, stat.st_size,
+                        stat.st_mtime_ns)
+    if index_path is not None:
+        index.save(index_path)
+    return index
+
+
+def fetch(index, key, **kwargs):
+    """Read and parse a single record of an indexed XML file.
+
+    `index` is a :class:`RecordIndex` or the path of a saved one. The record
+    is returned in the same shape `item_callback` receives when streaming at
+    the indexed `item_depth`; pass the parse options that were used to build
+    the index.
+    """
+    if not isinstance(index, RecordIndex):
+        index = RecordIndex.load(index)
+    start, end, ancestors = index.locate(key)
+    with open(index.source, 'rb') as stream:
+        stat = os.fstat(stream.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != (index.size, index.mtime):
+            raise ValueError("source file changed since it was indexed")
+        pieces = [data for _, data in _replay_prefix(stream, ancestors)]
+        stream.seek(start)
+        pieces.append(stream.read(end - start))
+    found = []
+
+    def capture(path, item):
+        found.append(item)
+        return False
+
+    try:
+        parse(b''.join(pieces), item_depth=index.item_depth,
+              item_callback=capture, **kwargs)
+    except ParsingInterrupted:
+        pass
+    return found[0]
+
+
+class _PathFilterHandler(_DictSAXHandler):
+    """Builds only the elements at the end of `target`, a tuple of names,
+    and skips every subtree that cannot contain one."""
+
+    def __init__(self, target, **kwargs):
+        super().__init__(item_depth=len(target), **kwargs)
+        self.target = target
+
+    def startElement(self, full_name, attrs):
+        depth = len(self.path)
+        if (depth < self.item_depth
+                and self._build_name(full_name) != self.target[depth]):
+            if self.limits:
+                self._check_limits(attrs)
+            self._start_skipping()
+            return
+        super().startElement(full_name, attrs)
+
+    def endElement(self, full_name):
+        if len(self.path) == self.item_depth:
+            # Give the item its text the way a full parse would, which the
+            # streaming branch of endElement does not do.
+            data = (None if not self.data
+                    else self.cdata_separator.join(self.data))
+            if self.strip_whitespace and data:
+                data = data.strip() or None
+            name = self._build_name(full_name)
+            if (data and self.item is None
+                    and self._should_force_cdata(name, data)):
+                self.item = self.dict_constructor()
+            if self.item is not None and data:
+                self.push_data(self.item, self.cdata_key, data)
+                data = None
+            self.data = [data] if data else []
+        super().endElement(full_name)
+
+
+def _input_chunks(xml_input, chunk_size):
+    if isinstance(xml_input, (bytes, bytearray, memoryview)):
+        view = memoryview(xml_input)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    elif hasattr(xml_input, 'read'):
+        # Text streams return '' at the end, binary ones b''.
+        while chunk := xml_input.read(chunk_size):
+            yield chunk
+    else:
+        yield from xml_input
+
+
+def find_all(xml_input, path, chunk_size=65536, **kwargs):
+    """Yield every element found at `path`, in the shape `parse` gives it.
+
+    `path` is a sequence of element names from the root, or a string of
+    them separated by ``/``. Only the matching elements are built: any other
+    subtree is skipped by bare expat handlers, and the input is read
+    `chunk_size` bytes at a time, so it is not read any further than needed
+    when the generator is not exhausted::
+
+        >>> list(xmltodict.find_all('<a><b>1</b><c><b>2</b></c><b>3</b></a>',
+        ...                         'a/b'))
+        ['1', '3']
+
+    Other keyword arguments are passed to the parser, as for :func:`parse`.
+    """
+    return _find(xml_input, path, False, chunk_size, **kwargs)
+
+
+def find_first(xml_input, path, default=None, chunk_size=65536, **kwargs):
+    """Return the first element found at `path` (see :func:`find_all`), or
+    `default` if there is none.
+
+    Parsing stops as soon as that element is complete, so looking up a
+    header at the top of a huge document only reads the start of it::
+
+        >>> with open('feed.xml', 'rb') as f:
+        ...     header = xmltodict.find_first(f, 'feed/header')
+    """
+    for item in _find(xml_input, path, True, chunk_size, **kwargs):
+        return item
+    return default
+
+
+def _find(xml_input, path, first, chunk_size, encoding=None, expat=expat,
+          process_namespaces=False, namespace_separator=':',
+          disable_entities=True, max_bytes=None, **kwargs):
+    target = tuple(path.strip('/').split('/') if isinstance(path, str)
+                   else path)
+    if not target:
+        raise ValueError("path must name at least one element")
+    if isinstance(xml_input, str):
+        encoding = encoding or 'utf-8'
+        xml_input = xml_input.encode(encoding)
+    found = []
+
+    def collect(path, item):
+        found.append(item)
+        return not first
+
+    kwargs.setdefault('path_attribs', False)
+    handler, parser = _make_parser(
+        _PathFilterHandler, encoding, expat, process_namespaces,
+        namespace_separator, disable_entities, target=target,
+        item_callback=collect, **kwargs)
+    chunks = _input_chunks(xml_input, chunk_size)
+    if max_bytes is not None:
+        chunks = _limited_chunks(chunks, max_bytes)
+    try:
+        for chunk in chunks:
+            parser.Parse(chunk, False)
+            yield from found
+            found.clear()
+        parser.Parse(b'', True)
+    except ParsingInterrupted:
+        pass
+    yield from found
+
+
+def follow(path, item_depth=2, state_file=None, poll_interval=0.1,
+           max_interval=2.0, idle_timeout=None, chunk_size=65536,
+           encoding=None, expat=expat, process_namespaces=False,
+           namespace_separator=':', disable_entities=True, **kwargs):
+    """Yield the items at `item_depth` of the XML file at `path` as it grows.
+
+    This is ``tail -f`` for documents that are appended to and never closed,
+    such as logs: the items already in the file are yielded, then the file
+    is polled for more data, waiting `poll_interval` seconds at first and
+    up to `max_interval` seconds as it stays idle. The generator ends once
+    the root element is closed, or after `idle_timeout` seconds without new
+    data if that is set.
+
+    With `state_file`, the position after the last item consumed is saved
+    to that file (as JSON) and a later call with the same `state_file`
+    resumes right after it, without reading the file again from the start.
+    An item counts as consumed once the next one is requested, so the item
+    being handled when the consumer fails or closes the generator is yielded
+    again after a restart. The state is saved whenever the file has no new
+    data and when the generator is closed, so after a crash a few more items
+    may be yielded again. `state_file` requires `item_depth` of at least 2.
+
+    Other arguments are as for :func:`parse`::
+
+        >>> for event in xmltodict.follow('events.xml',
+        ...                               state_file='events.state'):
+        ...     handle(event)
+    """
+    if item_depth < 1:
+        raise ValueError("item_depth must be at least 1")
+    if state_file is not None and item_depth < 2:
+        raise ValueError("state_file requires item_depth of at least 2")
+    found = []
+
+    def collect(item_path, item, checkpoint):
+        found.append((item, checkpoint))
+        return True
+
+    handler, parser = _make_parser(
+        _DictSAXHandler, encoding, expat, process_namespaces,
+        namespace_separator, disable_entities, item_depth=item_depth,
+        item_callback=collect, checkpoints=True, **kwargs)
+    checkpoint = _load_state(state_file)
+    saved = checkpoint
+    with open(path, 'rb') as f:
+        if checkpoint is not None:
+            _resume(parser, handler, f, checkpoint)
+        interval = poll_interval
+        idle_since = time.monotonic()
+        seen_root = bool(handler.path)
+        try:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    if checkpoint != saved:
+                        _save_state(state_file, checkpoint)
+                        saved = checkpoint
+                    if (idle_timeout is not None and
+                            time.monotonic() - idle_since >= idle_timeout):
+                        return
+                    time.sleep(interval)
+                    interval = min(interval * 2, max_interval)
+                    continue
+                interval = poll_interval
+                idle_since = time.monotonic()
+                # Parse in small blocks: locating the end of each item copies
+                # the rest of the current block.
+                for block in _small_blocks((data,)):
+                    parser.Parse(block, False)
+                for item, item_checkpoint in found:
+                    yield item
+                    checkpoint = item_checkpoint
+                found.clear()
+                if handler.path:
+                    seen_root = True
+                elif seen_root:
+                    parser.Parse(b'', True)
+                    return
+        finally:
+            if checkpoint != saved:
+                _save_state(state_file, checkpoint)
+
+
+def _load_state(state_file):
+    if state_file is None:
+        return None
+    try:
+        with open(state_file) as f:
+            offset, ancestors = json.load(f)
+    except FileNotFoundError:
+        return None
+    return Checkpoint(offset, tuple(ancestors))
+
+
+def _save_state(state_file, checkpoint):
+    if state_file is None or checkpoint is None:
+        return
+    temp_path = f'{state_file}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, state_file)
+
+
+ScanResult = namedtuple(
+    'ScanResult',
+    ('elements', 'attributes', 'text_lengths', 'max_depth', 'repeated'))
+ScanResult.__doc__ = """Statistics gathered by :func:`scan`.
+
+Paths are tuples of element names from the root. `elements` maps each path
+to the number of elements found there, `attributes` maps paths to the number
+of times each attribute name occurs, and `text_lengths` maps paths to a
+histogram of the length of their (stripped) text, keyed by powers of two:
+the count under ``8`` is that of texts of 8 to 15 characters. `max_depth`
+is the deepest nesting found, and `repeated` is the set of paths that occur
+more than once within the same parent element, which are the candidates for
+`force_list`.
+"""
+
+
+class _ScanHandler:
+    # Paths are numbered as they are first seen, so that the per-element work
+    # is a lookup by name in the children of the current path and updates of
+    # lists indexed by path number. They become tuples in result().
+    def __init__(self, namespace_separator=':'):
+        self.node = 0
+        self.names = [None]
+        self.parents = [None]
+        self.children = [{}]
+        self.counts = [1]
+        self.last_parent = [0]
+        self.attributes = {}
+        self.text_lengths = {}
+        self.repeated = set()
+        self.max_depth = 0
+        self.stack = []
+        self.text = None
+
+    def startNamespaceDecl(self, prefix, uri):
+        pass
+
+    def startElement(self, name, attrs):
+        node = self.node
+        child = self.children[node].get(name)
+        if child is None:
+            child = len(self.names)
+            self.children[node][name] = child
+            self.names.append(name)
+            self.parents.append(node)
+            self.children.append({})
+            self.counts.append(0)
+            self.last_parent.append(0)
+        self.counts[child] += 1
+        # The count of the parent path numbers the parent element, so seeing
+        # the same number twice means a repeated sibling.
+        parent_number = self.counts[node]
+        if self.last_parent[child] == parent_number:
+            self.repeated.add(child)
+        else:
+            self.last_parent[child] = parent_number
+        if attrs:
+            counts = self.attributes.get(child)
+            if counts is None:
+                counts = self.attributes[child] = {}
+            for key in attrs[0::2]:
+                counts[key] = counts.get(key, 0) + 1
+        self.stack.append((node, self.text))
+        self.node = child
+        self.text = None
+        if len(self.stack) > self.max_depth:
+            self.max_depth = len(self.stack)
+
+    def endElement(self, name):
+        if self.text:
+            length = len(''.join(self.text).strip())
+            if length:
+                bucket = 1 << (length.bit_length() - 1)
+                histogram = self.text_lengths.get(self.node)
+                if histogram is None:
+                    histogram = self.text_lengths[self.node] = {}
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+        self.node, self.text = self.stack.pop()
+
+    def characters(self, data):
+        if self.text is not None:
+            self.text.append(data)
+        elif not data.isspace():
+            self.text = [data]
+
+    def result(self):
+        paths = [()]
+        for node in range(1, len(self.names)):
+            paths.append(paths[self.parents[node]] + (self.names[node],))
+        return ScanResult(
+            {paths[node]: self.counts[node]
+             for node in range(1, len(paths))},
+            {paths[node]: counts
+             for node, counts in self.attributes.items()},
+            {paths[node]: histogram
+             for node, histogram in self.text_lengths.items()},
+            self.max_depth,
+            {paths[node] for node in self.repeated})
+
+
+def scan(xml_input, encoding=None, expat=expat, process_namespaces=False,
+         namespace_separator=':', disable_entities=True, max_bytes=None):
+    """Gather statistics about the structure of a document without building
+    it, and return them as a :class:`ScanResult`.
+
+    Only counters are updated for each element, so even huge files can be
+    scanned quickly, e.g. to count the records of a feed before importing it
+    or to find which elements need `force_list`::
+
+        >>> result = xmltodict.scan('<a><b x="1">hi</b><b/></a>')
+        >>> result.elements
+        {('a',): 1, ('a', 'b'): 2}
+        >>> result.repeated
+        {('a', 'b')}
+
+    `xml_input` and the other arguments are as for :func:`parse`.
+    """
+    if isinstance(xml_input, str):
+        encoding = encoding or 'utf-8'
+        xml_input = xml_input.encode(encoding)
+    handler, parser = _make_parser(
+        _ScanHandler, encoding, expat, process_namespaces,
+        namespace_separator, disable_entities)
+    _feed(parser, xml_input, max_bytes)
+    return handler.result()
+
+
+class _Encoded(list):
+    """The JSON texts of the values of one key of the root element."""
+
+    __slots__ = ('forced',)
+
+
+class _JSONHandler(_DictSAXHandler):
+    """Encodes each value added to the root element as soon as it is
+    complete, so that the document is held as JSON text rather than as a
+    tree of dicts until the root element closes."""
+
+    def __init__(self, encoder, **kwargs):
+        super().__init__(**kwargs)
+        self.encoder = encoder
+        self.root_item = None
+
+    def startElement(self, full_name, attrs):
+        super().startElement(full_name, attrs)
+        if len(self.path) == 1:
+            if self.item is None:
+                self.item = self.dict_constructor()
+            self.root_item = self.item
+
+    def endElement(self, full_name):
+        if len(self.path) == 1 and not self.root_item:
+            # Leave an empty or text-only root to the usual code path.
+            self.item = None
+        super().endElement(full_name)
+
+    def push_data(self, item, key, data):
+        if item is None or item is not self.root_item:
+            return super().push_data(item, key, data)
+        if self.postprocessor is not None:
+            result = self.postprocessor(self.path, key, data)
+            if result is None:
+                return item
+            key, data = result
+        values = item.get(key)
+        if values is None or not isinstance(values, _Encoded):
+            forced = values is None and self._should_force_list(key, data)
+            encoded = _Encoded() if values is None else _Encoded(
+                [self.encoder.encode(values)])
+            encoded.forced = forced
+            item[key] = values = encoded
+        values.append(self.encoder.encode(data))
+        return item
+
+
+def _write_json(value, encoder, write):
+    # Write a value holding the root element built by _JSONHandler.
+    if isinstance(value, _Encoded):
+        if len(value) == 1 and not value.forced:
+            write(value[0])
+        else:
+            write('[')
+            write(encoder.item_separator.join(value))
+            write(']')
+    elif isinstance(value, dict):
+        write('{')
+        separator = ''
+        for key, item in value.items():
+            write(separator)
+            write(encoder.encode(key))
+            write(encoder.key_separator)
+            _write_json(item, encoder, write)
+            separator = encoder.item_separator
+        write('}')
+    elif isinstance(value, list):
+        write('[')
+        separator = ''
+        for item in value:
+            write(separator)
+            _write_json(item, encoder, write)
+            separator = encoder.item_separator
+        write(']')
+    else:
+        write(encoder.encode(value))
+
+
+def xml_to_json(xml_input, output=None, item_depth=0, lines=True,
+                json_options=None, **kwargs):
+    """Convert XML to JSON with the same structure `parse` produces.
+
+    With `item_depth=0` the whole document is written as a single JSON value.
+    Each child of the root element is encoded as soon as it closes, so only
+    JSON text is kept until the root element closes, not a tree of dicts
+    (output cannot start earlier, as a later sibling of the same name turns
+    an earlier value into a list).
+
+    Otherwise each item found at `item_depth` is written out and discarded
+    as soon as it is complete, so memory use is bounded by the largest item:
+    one JSON value per line (JSON Lines) by default, or a single JSON array
+    if `lines` is `False`.
+
+    The result is written to `output` (a text file-like object) or returned
+    as a string if it is `None`. `json_options` are passed to `json.dumps`,
+    and other keyword arguments to :func:`parse`::
+
+        >>> xmltodict.xml_to_json('<a><b>1</b><b>2</b></a>', item_depth=2)
+        '"1"\\n"2"\\n'
+    """
+    must_return = output is None
+    if must_return:
+        output = StringIO()
+    encoder = json.JSONEncoder(**(json_options or {}))
+    if not item_depth and (encoder.indent is not None or encoder.sort_keys):
+        output.write(encoder.encode(parse(xml_input, **kwargs)))
+    elif not item_depth:
+        handler = _parse(_JSONHandler, xml_input, encoder=encoder, **kwargs)
+        _write_json(handler.item, encoder, output.write)
+    else:
+        count = 0
+
+        def write_item(path, item):
+            nonlocal count
+            if not lines:
+                output.write(encoder.item_separator if count else '[')
+            output.write(encoder.encode(item))
+            if lines:
+                output.write('\n')
+            count += 1
+            return True
+
+        parse(xml_input, item_depth=item_depth, item_callback=write_item,
+              **kwargs)
+        if not lines:
+            output.write(']' if count else '[]')
+    if must_return:
+        return output.getvalue()
+
+
+def _flatten(value, sep='.', prefix='', out=None):
+    """Flatten a parsed item into a dict of column names to values.
+
+    Nested keys are joined with `sep`. A list becomes a list of values in
+    each of its columns, aligned by position (with `None` where an element
+    lacks a key), so that ``<t k="a"/><t k="b"/>`` gives ``{'t.@k': ['a',
+    'b']}``. A bare text item is stored under the empty name.
+    """
+    if out is None:
+        out = {}
+    if isinstance(value, _MAPPING_TYPES):
+        for key, item in value.items():
+            key = prefix + sep + key if prefix else key
+            if item is None or item.__class__ is str:
+                out[key] = item
+            else:
+                _flatten(item, sep, key, out)
+    elif isinstance(value, list):
+        rows = [_flatten(item, sep, prefix) for item in value]
+        columns = dict.fromkeys(key for row in rows for key in row)
+        for key in columns:
+            out[key] = [row.get(key) for row in rows]
+    elif value is not None or prefix:
+        out[prefix] = value
+    return out
+
+
+def _item_batches(xml_input, item_depth, batch_size, sep, write_batch,
+                  kwargs):
+    """Stream `xml_input`, passing the items at `item_depth` to
+    `write_batch` in lists of up to `batch_size` items flattened with
+    `sep`."""
+    if item_depth < 1:
+        raise ValueError("item_depth must be at least 1")
+    cdata_key = kwargs.get('cdata_key', '#text')
+    batch = []
+
+    def collect(path, item):
+        row = _flatten(item, sep)
+        if '' in row:
+            row[cdata_key] = row.pop('')
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            batch.clear()
+        return True
+
+    kwargs.setdefault('path_attribs', False)
+    parse(xml_input, item_depth=item_depth, item_callback=collect, **kwargs)
+    if batch:
+        write_batch(batch)
+
+
+def _select_columns(batch, columns):
+    # `columns` maps output column names to flattened keys; by default all
+    # the keys found in the first batch are used under their own names.
+    if columns is None:
+        return {key: key for key in dict.fromkeys(
+            key for row in batch for key in row)}
+    if isinstance(columns, _MAPPING_TYPES):
+        return dict(columns)
+    return {key: key for key in columns}
+
+
+_SQLITE_INTEGER_RE = re.compile(r'-?(?:0|[1-9][0-9]*)\Z')
+_SQLITE_REAL_RE = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?\Z')
+
+
+def _sqlite_type(values):
+    # Declare the column affinity from the first batch, so that SQLite
+    # stores numbers as numbers. Only values that come back unchanged count:
+    # codes such as '007', ids beyond 64 bits and decimals such as '1.10'
+    # stay text.
+    values = [value for value in values if value is not None]
+    if not values or not all(isinstance(value, str) for value in values):
+        return 'TEXT'
+    if all(_SQLITE_INTEGER_RE.match(value)
+           and -2 ** 63 <= int(value) < 2 ** 63 for value in values):
+        return 'INTEGER'
+    if all(_SQLITE_REAL_RE.match(value) and repr(float(value)) == value
+           for value in values):
+        return 'REAL'
+    return 'TEXT'
+
+
+def load_sqlite(xml_input, database, table, item_depth=2, columns=None,
+                batch_size=1000, sep='.', **kwargs):
+    """Stream the items at `item_depth` into the SQLite table `table`.
+
+    `database` is a path or an open :class:`sqlite3.Connection`. Each item is
+    flattened to one row: nested keys are joined with `sep` (``'@id'``,
+    ``'address.city'``) and repeated children are stored as JSON arrays.
+    `columns` selects the columns to load, either as a list of flattened
+    keys or as a mapping of column names to flattened keys. It defaults to
+    every key found in the first batch of items; later keys that are not
+    columns are ignored.
+
+    The table is created if it does not exist, with column types inferred
+    from the first batch. Rows are inserted `batch_size` at a time with
+    `executemany`, all in one transaction that is rolled back if parsing
+    fails. Other keyword arguments are passed to :func:`parse`. Returns the
+    number of rows inserted::
+
+        >>> with open('catalog.xml', 'rb') as f:
+        ...     xmltodict.load_sqlite(f, 'catalog.db', 'items')
+        120000
+    """
+    import sqlite3
+    connection = database
+    if not isinstance(database, sqlite3.Connection):
+        connection = sqlite3.connect(database)
+    state = {'insert': None, 'keys': None, 'count': 0}
+
+    def quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def write_batch(batch):
+        if state['insert'] is None:
+            selected = _select_columns(batch, columns)
+            state['keys'] = list(selected.values())
+            definitions = ', '.join(
+                quote(name) + ' ' + _sqlite_type(
+                    [row.get(key) for row in batch])
+                for name, key in selected.items())
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {quote(table)} ({definitions})')
+            state['insert'] = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                quote(table), ', '.join(map(quote, selected)),
+                ', '.join('?' * len(selected)))
+        keys = state['keys']
+        connection.executemany(state['insert'], (
+            [json.dumps(value) if isinstance(value, list) else value
+             for value in map(row.get, keys)]
+            for row in batch))
+        state['count'] += len(batch)
+
+    try:
+        with connection:
+            _item_batches(xml_input, item_depth, batch_size, sep,
+                          write_batch, kwargs)
+    finally:
+        if connection is not database:
+            connection.close()
+    return state['count']
+
+
+def xml_to_csv(xml_input, output=None, item_depth=2, columns=None, sep='.',
+               lists='join', list_separator='|', batch_size=1000,
+               dialect='excel', **kwargs):
+    """Convert the items at `item_depth` to CSV rows, one item at a time.
+
+    Each item is flattened like in :func:`load_sqlite`: nested keys are
+    joined with `sep`, so columns are named after the keys `parse` would
+    produce (``'@id'``, ``'price'``, ``'tag.@k'``). `columns` selects and
+    orders the columns, as a list of flattened keys or a mapping of column
+    names to flattened keys; by default they are the keys found in the first
+    batch of `batch_size` items. A header row is written first.
+
+    Repeated children give several values for a column. With
+    ``lists='join'`` they are joined with `list_separator` in one cell; with
+    ``lists='explode'`` the item is written as one row per value instead,
+    the other columns being repeated. Values of different repeated columns
+    are paired by position.
+
+    The rows are written with the :mod:`csv` `dialect` (e.g. ``'excel-tab'``
+    for TSV) to `output`, a text file opened with ``newline=''``, or
+    returned as a string if it is `None`. Other keyword arguments are
+    passed to :func:`parse`::
+
+        >>> print(xmltodict.xml_to_csv(
+        ...     '<r><i id="1"><t>a</t><t>b</t></i></r>'), end='')
+        @id,t
+        1,a|b
+    """
+    import csv
+    if lists not in ('join', 'explode'):
+        raise ValueError("lists must be 'join' or 'explode'")
+    must_return = output is None
+    if must_return:
+        output = StringIO()
+    writer = csv.writer(output, dialect)
+    keys = None
+
+    def cell(value):
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            return list_separator.join(map(cell, value))
+        return value
+
+    def write_batch(batch):
+        nonlocal keys
+        if keys is None:
+            selected = _select_columns(batch, columns)
+            keys = list(selected.values())
+            writer.writerow(selected)
+        if lists == 'join':
+            writer.writerows([cell(row.get(key)) for key in keys]
+                             for row in batch)
+            return
+        for row in batch:
+            values = [row.get(key) for key in keys]
+            count = max((len(value) for value in values
+                         if isinstance(value, list)), default=0)
+            if not count:
+                writer.writerow(map(cell, values))
+                continue
+            writer.writerows(
+                [cell(value[index] if index < len(value) else None)
+                 if isinstance(value, list) else cell(value)
+                 for value in values]
+                for index in range(count))
+
+    _item_batches(xml_input, item_depth, batch_size, sep, write_batch,
+                  kwargs)
+    if keys is None and columns is not None:
+        writer.writerow(_select_columns([], columns))
+    if must_return:
+        return output.getvalue()
+
+
+def partition(xml_input, key, output_path, item_depth=2, format='jsonl',
+              max_open=64, buffer_size=65536, root=None, item_name=None,
+              json_options=None, unparse_options=None, **kwargs):
+    """Split the items at `item_depth` into several files in one pass.
+
+    `key` gives the partition of each item: either a callable taking
+    ``(path, item)``, or the name of a child or attribute (e.g. ``'@date'``)
+    of the item whose value is used (`None` if it is missing). `output_path`
+    turns a partition into a file name: a format string such as
+    ``'out/{key}.jsonl'``, which rejects partitions containing a path
+    separator, or a callable. Files are created, or truncated, the first
+    time a partition is seen.
+
+    With ``format='jsonl'`` each item is written as one line of JSON (using
+    `json_options`, as in :func:`xml_to_json`). With ``format='xml'`` each
+    file is a document with a `root` element holding the items as
+    `item_name` elements, both defaulting to the names found in the input;
+    `unparse_options` (e.g. ``{'pretty': True}``) are passed to
+    :func:`unparse`.
+
+    Items are written as soon as they are parsed. At most `max_open` files
+    are open at once, the least recently used being closed (and reopened to
+    append) as needed, each with a write buffer of `buffer_size` bytes.
+    Other keyword arguments are passed to :func:`parse`. Returns a dict of
+    the number of items written per partition::
+
+        >>> with open('orders.xml', 'rb') as f:
+        ...     xmltodict.partition(f, 'customer', 'orders/{key}.jsonl')
+        {'acme': 1200, 'globex': 310}
+    """
+    if format not in ('jsonl', 'xml'):
+        raise ValueError("format must be 'jsonl' or 'xml'")
+    if max_open < 1:
+        raise ValueError("max_open must be at least 1")
+    encoder = json.JSONEncoder(**(json_options or {}))
+    unparse_options = dict(unparse_options or {}, full_document=False)
+    encoding = unparse_options.pop('encoding', 'utf-8')
+    files = OrderedDict()
+    counts = {}
+    roots = {}
+    templates = {}
+
+    def file_name(name):
+        if callable(output_path):
+            return output_path(name)
+        # Partition names come from the input: keep them inside the
+        # directory chosen by the template.
+        if (name in ('', '.', '..') or os.sep in name
+                or (os.altsep and os.altsep in name)):
+            raise ValueError(f"invalid partition name {name!r}")
+        return output_path.format(key=name)
+
+    def open_file(name, root_name):
+        output = files.pop(name, None)
+        if output is None:
+            if len(files) >= max_open:
+                files.popitem(last=False)[1].close()
+            output = open(file_name(name), 'a' if name in counts else 'w',
+                          buffering=buffer_size, encoding=encoding)
+            if name not in counts and format == 'xml':
+                roots[name] = root_name
+                output.write(f'<?xml version="1.0" encoding="{encoding}"?>\n'
+                             f'<{root_name}>\n')
+        files[name] = output
+        return output
+
+    cdata_key = kwargs.get('cdata_key', '#text')
+
+    def write_item(path, item):
+        name = str(_record_key(key, path, item, cdata_key))
+        root_name = None
+        if format == 'xml':
+            root_name = root or path[-2][0]
+        output = open_file(name, root_name)
+        if format == 'jsonl':
+            output.write(encoder.encode(item))
+        else:
+            # Items usually share a shape: render them with a template made
+            # from the first one, which falls back to unparse for others.
+            obj = {item_name or path[-1][0]: item}
+            template = templates.get(path[-1][0])
+            if template is None:
+                template = templates[path[-1][0]] = compile_template(
+                    obj, encoding=encoding, **unparse_options)
+            output.write(template(obj))
+        output.write('\n')
+        counts[name] = counts.get(name, 0) + 1
+        return True
+
+    if item_depth < 1:
+        raise ValueError("item_depth must be at least 1")
+    if item_depth < 2 and format == 'xml' and root is None:
+        raise ValueError("format='xml' with item_depth=1 needs a root")
+    if root is not None:
+        _validate_name(root, "element")
+    try:
+        parse(xml_input, item_depth=item_depth, item_callback=write_item,
+              **kwargs)
+        for name, root_name in roots.items():
+            open_file(name, root_name).write(f'</{root_name}>\n')
+    finally:
+        for output in files.values():
+            output.close()
+    return counts
+
+
+def _parse_chunk(docs, kwargs):
+    return [parse(doc, **kwargs) for doc in docs]
+
+
+def _free_threaded():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _make_executor(workers, use_threads=None):
+    from concurrent import futures
+    if use_threads is None:
+        use_threads = _free_threaded()
+    if use_threads:
+        return futures.ThreadPoolExecutor(max_workers=workers)
+    return futures.ProcessPoolExecutor(max_workers=workers)
+
+
+def parse_many(docs, workers=None, chunksize=64, ordered=True,
+               use_threads=None, **kwargs):
+    """Parse an iterable of independent XML documents with a worker pool.
+
+    Documents are grouped in chunks of `chunksize` and handed to a pool of
+    `workers` processes (default: one per CPU). On free-threaded Python builds
+    a thread pool is used instead; pass `use_threads` to force either. With
+    `workers=1` the documents are parsed in the current process, which avoids
+    any pool overhead for small batches.
+
+    All other keyword arguments are passed to :func:`parse` and must be
+    picklable when a process pool is used.
+
+    Returns a generator. If `ordered` is `True` (default), it yields the
+    parsed documents in input order; otherwise it yields `(index, result)`
+    pairs as soon as each chunk completes::
+
+        >>> list(xmltodict.parse_many(['<a>1</a>', '<a>2</a>'], workers=1))
+        [{'a': '1'}, {'a': '2'}]
+
+    At most two chunks per worker are in flight at any time, so `docs` can be
+    an unbounded iterator such as a message queue consumer.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = iter(lambda it=iter(docs): list(islice(it, chunksize)), [])
+    if workers == 1:
+        return _parse_many_serial(chunks, ordered, kwargs)
+    return _parse_many_pool(chunks, workers, ordered, use_threads, kwargs)
+
+
+def _parse_many_serial(chunks, ordered, kwargs):
+    index = 0
+    for chunk in chunks:
+        for doc in chunk:
+            result = parse(doc, **kwargs)
+            yield result if ordered else (index, result)
+            index += 1
+
+
+def _parse_many_pool(chunks, workers, ordered, use_threads, kwargs):
+    from concurrent import futures
+    executor = _make_executor(workers, use_threads)
+    pending = {}
+    index = 0
+    try:
+        while True:
+            for chunk in islice(chunks, 2 * workers - len(pending)):
+                future = executor.submit(_parse_chunk, chunk, kwargs)
+                pending[future] = index
+                index += len(chunk)
+            if not pending:
+                break
+            if ordered:
+                done = [next(iter(pending))]
+            else:
+                done, _ = futures.wait(pending,
+                                       return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                start = pending.pop(future)
+                for offset, result in enumerate(future.result()):
+                    yield result if ordered else (start + offset, result)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+CacheInfo = namedtuple(
+    'CacheInfo', ('hits', 'misses', 'disk_hits', 'currsize', 'nbytes'))
+CacheInfo.__doc__ = """Statistics of a :class:`CachedParser`.
+
+`hits` counts lookups answered from memory, `disk_hits` those loaded from
+the cache directory and `misses` those that had to be parsed. `currsize` and
+`nbytes` are the number and total encoded size of the entries in memory.
+"""
+
+# Bumped whenever the key or the blob format of CachedParser changes, so that
+# stale files in a cache directory are never read.
+_CACHE_FORMAT = 1
+
+
+class CachedParser:
+    """Parse XML documents, caching the results by content and options.
+
+    Results are keyed on the SHA-256 of the input bytes together with the
+    parse options, so the same document is parsed once no matter where it
+    comes from. The keyword arguments given here are the default options for
+    :meth:`parse`::
+
+        >>> parser = xmltodict.CachedParser(maxsize=256, force_list=('item',))
+        >>> config = parser.parse(open('config.xml', 'rb'))
+
+    Entries are kept in memory in least recently used order, at most
+    `maxsize` of them (`None` for no limit) and, if `max_bytes` is given, at
+    most that many bytes of encoded results. With `cache_dir`, results are
+    also written to files in that directory and read back on a memory miss,
+    so they are shared between processes and survive restarts. Results that
+    depend on callables other than classes (e.g. a `postprocessor`) are only
+    cached in memory, as their key is not stable across processes.
+
+    Results are stored in a compact binary form (`marshal`, or `pickle` for
+    a `dict_constructor` other than `dict`), and every call returns a fresh
+    copy that the caller is free to modify. A parser can be shared between
+    threads; :meth:`cache_info` returns hit and miss counters.
+    """
+
+    def __init__(self, maxsize=128, max_bytes=None, cache_dir=None,
+                 **kwargs):
+        if kwargs.get('item_depth', 0):
+            raise ValueError("CachedParser does not support streaming mode")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.options = kwargs
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._hits = self._misses = self._disk_hits = 0
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def parse(self, xml_input, **kwargs):
+        """Return ``xmltodict.parse(xml_input, **options)``, from the cache if
+        possible. `kwargs` override the options given to the constructor."""
+        options = dict(self.options, **kwargs)
+        if options.get('item_depth', 0):
+            raise ValueError("CachedParser does not support streaming mode")
+        data = _read_input(xml_input, options.get('encoding'))
+        key, callables = self._key(data, options)
+        persistent = not callables
+        with self._lock:
+            entry = self._entries.get(key)
+            blob = None
+            if entry is not None:
+                blob = entry[0]
+                self._entries.move_to_end(key)
+                self._hits += 1
+        if blob is None and persistent and self.cache_dir is not None:
+            blob = self._read_file(key)
+            if blob is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                self._store(key, blob, callables)
+        if blob is not None:
+            return _decode_result(blob)
+        with self._lock:
+            self._misses += 1
+        result = parse(data, **options)
+        blob = _encode_result(result, options.get('dict_constructor', dict))
+        self._store(key, blob, callables)
+        if persistent and self.cache_dir is not None:
+            self._write_file(key, blob)
+        return result
+
+    def cache_info(self):
+        """Return a :class:`CacheInfo` with the current statistics."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._disk_hits,
+                             len(self._entries), self._nbytes)
+
+    def cache_clear(self):
+        """Drop the in-memory entries and reset the statistics. Files in
+        `cache_dir` are left alone."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self._hits = self._misses = self._disk_hits = 0
+
+    def _key(self, data, options):
+        """Return the cache key of `data` parsed with `options`, and the
+        callables other than classes found in the options."""
+        callables = []
+        token = _cache_token(options, callables)
+        digest = hashlib.sha256(data)
+        digest.update(repr((_CACHE_FORMAT, token)).encode())
+        return digest.hexdigest(), callables
+
+    def _store(self, key, blob, callables=()):
+        if self.max_bytes is not None and len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= len(old[0])
+            # Keys of callables hold their id(): keep them alive as long as
+            # the entry, so that the id cannot be reused by another one.
+            self._entries[key] = (blob, tuple(callables))
+            self._nbytes += len(blob)
+            while ((self.maxsize is not None
+                    and len(self._entries) > self.maxsize)
+                   or (self.max_bytes is not None
+                       and self._nbytes > self.max_bytes)):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def _file_path(self, key):
+        return os.path.join(self.cache_dir, key + '.xmltodict')
+
+    def _read_file(self, key):
+        try:
+            with open(self._file_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_file(self, key, blob):
+        import tempfile
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(temp_path, self._file_path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _cache_token(value, callables):
+    # A stable, hashable stand-in for an option value: sets and dicts are
+    # sorted, since their repr depends on hash order, and callables other
+    # than classes are identified by id() and collected.
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted(
+            (_cache_token(item, callables) for item in value), key=repr)))
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(
+            ((repr(key), _cache_token(item, callables))
+             for key, item in value.items()), key=lambda pair: pair[0])))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,
+                tuple(_cache_token(item, callables) for item in value))
+    if callable(value) and not isinstance(value, type):
+        callables.append(value)
+        return ('callable', id(value))
+    return repr(value)
+
+
+def _read_input(xml_input, encoding=None):
+    if isinstance(xml_input, str):
+        return xml_input.encode(encoding or 'utf-8')
+    if isinstance(xml_input, (bytes, bytearray, memoryview)):
+        return bytes(xml_input)
+    if hasattr(xml_input, 'read'):
+        data = xml_input.read()
+        return data.encode(encoding or 'utf-8') if isinstance(data, str) else data
+    return b''.join(chunk.encode(encoding or 'utf-8')
+                    if isinstance(chunk, str) else chunk
+                    for chunk in xml_input)
+
+
+def _encode_result(result, dict_constructor=dict):
+    if dict_constructor is dict:
+        try:
+            return b'M' + marshal.dumps(_share_strings(result, {}), 4)
+        except ValueError:  # e.g. objects made by a postprocessor
+            pass
+    import pickle
+    return b'P' + pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_result(blob):
+    if blob[:1] == b'M':
+        return marshal.loads(memoryview(blob)[1:])
+    import pickle
+    return pickle.loads(memoryview(blob)[1:])
+
+
+_SNAPSHOT_MAGIC = b'XTDSNAP'
+_SNAPSHOT_VERSION = 1
+
+
+def dump_snapshot(obj, file):
+    """Write a parsed tree to `file` in a binary form that loads quickly.
+
+    `file` is a binary file object or a path. The tree may contain mappings
+    (including :class:`CompactNode`), lists, strings, `None` and numbers, as
+    produced by :func:`parse`. Equal strings, such as repeated keys and
+    values, are stored once, so snapshots are smaller than plain `marshal`
+    output and load faster, into a tree that shares those strings. Use
+    :func:`load_snapshot` to read it back.
+    """
+    data = marshal.dumps(_share_strings(obj, {}), 4)
+    header = _SNAPSHOT_MAGIC + bytes((_SNAPSHOT_VERSION,))
+    if hasattr(file, 'write'):
+        file.write(header)
+        file.write(data)
+    else:
+        with open(file, 'wb') as f:
+            f.write(header)
+            f.write(data)
+
+
+def load_snapshot(file):
+    """Read a tree written by :func:`dump_snapshot` from `file` (a binary
+    file object or a path). Mappings are loaded as plain dicts."""
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as f:
+            return load_snapshot(f)
+    header = file.read(len(_SNAPSHOT_MAGIC) + 1)
+    if header[:-1] != _SNAPSHOT_MAGIC:
+        raise ValueError("not an xmltodict snapshot")
+    if header[-1] != _SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {header[-1]}")
+    return marshal.loads(file.read())
+
+
+def _share_strings(value, table):
+    # Copy the tree, replacing equal strings by one object so that marshal
+    # writes each of them once and back-references after that.
+    if isinstance(value, str):
+        return table.setdefault(value, value)
+    if isinstance(value, _MAPPING_TYPES):
+        return {table.setdefault(key, key) if isinstance(key, str) else key:
+                _share_strings(item, table) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_share_strings(item, table) for item in value]
+    return value
 
 
 def _convert_value_to_string(value, encoding='utf-8', bytes_errors='replace'):
@@ -453,7 +2390,9 @@ def _emit(key, value, content_handler,
           expand_iter=None,
           encoding='utf-8',
           bytes_errors='replace',
-          comment_key='#comment'):
+          comment_key='#comment',
+          parallel=None,
+          preprocessed=False):
     if isinstance(key, str) and key == comment_key:
         comments_list = value if isinstance(value, list) else [value]
         if isinstance(indent, int):
@@ -473,22 +2412,24 @@ def _emit(key, value, content_handler,
                 content_handler.ignorableWhitespace(newl)
         return
 
-    key = _process_namespace(key, namespaces, namespace_separator, attr_prefix)
-    if preprocessor is not None:
-        result = preprocessor(key, value)
-        if result is None:
-            return
-        key, value = result
+    if not preprocessed:
+        key = _process_namespace(key, namespaces, namespace_separator,
+                                 attr_prefix)
+        if preprocessor is not None:
+            result = preprocessor(key, value)
+            if result is None:
+                return
+            key, value = result
     # Minimal validation to avoid breaking out of tag context
     _validate_name(key, "element")
-    if not hasattr(value, '__iter__') or isinstance(value, (str, bytes, bytearray, memoryview, dict)):
+    if not hasattr(value, '__iter__') or isinstance(value, _NON_SEQUENCE_TYPES):
         value = [value]
     for index, v in enumerate(value):
         if full_document and depth == 0 and index > 0:
             raise ValueError('document with multiple roots')
         if v is None:
             v = {}
-        elif not isinstance(v, (dict, str)):
+        elif not isinstance(v, (str, dict, CompactNode)):
             if expand_iter and hasattr(v, '__iter__') and not isinstance(v, (bytes, bytearray, memoryview)):
                 v = {expand_iter: v}
             else:
@@ -508,7 +2449,7 @@ def _emit(key, value, content_handler,
             if isinstance(ik, str) and ik.startswith(attr_prefix):
                 ik = _process_namespace(ik, namespaces, namespace_separator,
                                         attr_prefix)
-                if ik == '@xmlns' and isinstance(iv, dict):
+                if ik == '@xmlns' and isinstance(iv, _MAPPING_TYPES):
                     for k, v in iv.items():
                         _validate_name(k, "attribute")
                         attr = 'xmlns{}'.format(f':{k}' if k else '')
@@ -535,6 +2476,20 @@ def _emit(key, value, content_handler,
         if pretty and children:
             content_handler.ignorableWhitespace(newl)
         for child_key, child_value in children:
+            if (parallel is not None and isinstance(child_value, list)
+                    and len(child_value) > parallel[2]):
+                _emit_chunks(child_key, child_value, content_handler,
+                             parallel, dict(
+                                 attr_prefix=attr_prefix,
+                                 cdata_key=cdata_key, depth=depth+1,
+                                 preprocessor=preprocessor, pretty=pretty,
+                                 newl=newl, indent=indent,
+                                 namespaces=namespaces,
+                                 namespace_separator=namespace_separator,
+                                 expand_iter=expand_iter, encoding=encoding,
+                                 bytes_errors=bytes_errors,
+                                 comment_key=comment_key))
+                continue
             _emit(child_key, child_value, content_handler,
                   attr_prefix, cdata_key, depth+1, preprocessor,
                   pretty, newl, indent, namespaces=namespaces,
@@ -550,7 +2505,90 @@ def _emit(key, value, content_handler,
             content_handler.ignorableWhitespace(newl)
 
 
+def _check_bytes_errors(bytes_errors):
+    try:
+        codecs.lookup_error(bytes_errors)
+    except LookupError as exc:
+        raise ValueError(f"Invalid bytes_errors handler: {bytes_errors}") from exc
+
+
+def _emit_fragment(key, items, short_empty_elements, options):
+    output = StringIO()
+    content_handler = _XMLGenerator(output, options['encoding'],
+                                    short_empty_elements)
+    _emit(key, items, content_handler, full_document=False, preprocessed=True,
+          **options)
+    return output.getvalue()
+
+
+def _emit_chunks(key, items, content_handler, parallel, options):
+    """Serialize the list `items` of `key` elements in a worker pool.
+
+    The list is cut into chunks of `chunksize` items, each chunk is rendered
+    to a string by `_emit_fragment` and the fragments are written in order as
+    raw text, so the output is the same as a serial `_emit` of `items`.
+    The namespace mapping and the preprocessor are applied to the whole list
+    first, as `_emit` does.
+    """
+    executor, workers, chunksize, short_empty_elements = parallel
+    key = _process_namespace(key, options['namespaces'],
+                             options['namespace_separator'],
+                             options['attr_prefix'])
+    preprocessor = options['preprocessor']
+    if preprocessor is not None:
+        result = preprocessor(key, items)
+        if result is None:
+            return
+        key, items = result
+    if not isinstance(items, list) or len(items) <= chunksize:
+        _emit(key, items, content_handler, preprocessed=True, **options)
+        return
+    chunks = (items[i:i + chunksize] for i in range(0, len(items), chunksize))
+    pending = []
+    for chunk in chunks:
+        pending.append(executor.submit(_emit_fragment, key, chunk,
+                                       short_empty_elements, options))
+        if len(pending) >= 2 * workers:
+            content_handler.ignorableWhitespace(pending.pop(0).result())
+    for future in pending:
+        content_handler.ignorableWhitespace(future.result())
+
+
 class _XMLGenerator(XMLGenerator):
+    def __init__(self, out=None, encoding='utf-8',
+                 short_empty_elements=False, buffer_size=0):
+        super().__init__(out, encoding, short_empty_elements)
+        self._pending = []
+        if buffer_size:
+            # XMLGenerator writes every tag, attribute and text node
+            # separately; collect them and write in blocks instead. The size
+            # of the collected text is only checked after closing an element,
+            # and as rarely as the sizes seen so far allow.
+            self._buffer_size = buffer_size
+            self._check_at = 64
+            self._write_through = self._write
+            self._flush_through = self._flush
+            self._write = self._pending.append
+            self._flush = self.flush
+            self.endElement = self._buffered_end_element
+
+    def _buffered_end_element(self, name):
+        XMLGenerator.endElement(self, name)
+        pending = self._pending
+        if len(pending) >= self._check_at:
+            size = sum(map(len, pending))
+            self._check_at = max(
+                len(pending) * self._buffer_size // max(size, 1), 1)
+            if size >= self._buffer_size:
+                self._write_through(''.join(pending))
+                pending.clear()
+
+    def flush(self):
+        if self._pending:
+            self._write_through(''.join(self._pending))
+            self._pending.clear()
+            self._flush_through()
+
     def comment(self, text):
         text = _validate_comment(text)
         self._write(f"<!--{escape(text)}-->")
@@ -558,11 +2596,14 @@ class _XMLGenerator(XMLGenerator):
 
 def unparse(input_dict, output=None, encoding='utf-8', full_document=True,
             short_empty_elements=False, comment_key='#comment',
-            **kwargs):
+            buffer_size=65536, as_bytes=False, workers=1, chunksize=1000,
+            use_threads=None, **kwargs):
     """Emit an XML document for the given `input_dict` (reverse of `parse`).
 
     The resulting XML document is returned as a string, but if `output` (a
-    file-like object) is specified, it is written there instead.
+    file-like object) is specified, it is written there instead. With
+    `as_bytes=True` the document is encoded with `encoding` as it is written
+    and returned as `bytes`, saving a full copy when it is sent on as is.
 
     Dictionary keys prefixed with `attr_prefix` (default=`'@'`) are interpreted
     as XML node attributes, whereas keys equal to `cdata_key`
@@ -578,45 +2619,66 @@ def unparse(input_dict, output=None, encoding='utf-8', full_document=True,
     The `bytes_errors` parameter controls decoding errors for byte values and
     defaults to `'replace'`.
 
+    When writing to `output`, the XML is collected and written in blocks of
+    about `buffer_size` characters (default 64 KiB) rather than one write per
+    tag, attribute and text node, which matters for unbuffered files, pipes
+    and sockets. Set it to `0` to write through immediately.
+
+    With `workers` greater than 1, child lists of the root element longer
+    than `chunksize` items (e.g. ``{'rows': {'row': [...]}}``) are split into
+    chunks that are serialized by a pool of `workers` processes (threads on
+    free-threaded builds, or as forced by `use_threads`) and written back in
+    order. The output is identical to the serial one; the chunks and any
+    `preprocessor` must be picklable when processes are used.
+
     """
     bytes_errors = kwargs.pop('bytes_errors', 'replace')
-    try:
-        codecs.lookup_error(bytes_errors)
-    except LookupError as exc:
-        raise ValueError(f"Invalid bytes_errors handler: {bytes_errors}") from exc
+    _check_bytes_errors(bytes_errors)
 
     must_return = False
     if output is None:
-        output = StringIO()
+        output = BytesIO() if as_bytes else StringIO()
         must_return = True
-    if short_empty_elements:
-        content_handler = _XMLGenerator(output, encoding, True)
-    else:
-        content_handler = _XMLGenerator(output, encoding)
+    if must_return and not as_bytes:
+        buffer_size = 0
+    content_handler = _XMLGenerator(output, encoding, short_empty_elements,
+                                    buffer_size)
+    parallel = None
+    if workers > 1:
+        parallel = (_make_executor(workers, use_threads), workers, chunksize,
+                    short_empty_elements)
     if full_document:
         content_handler.startDocument()
     seen_root = False
-    for key, value in input_dict.items():
-        if key != comment_key and full_document and seen_root:
-            raise ValueError("Document must have exactly one root.")
-        _emit(
-            key,
-            value,
-            content_handler,
-            full_document=full_document,
-            encoding=encoding,
-            bytes_errors=bytes_errors,
-            comment_key=comment_key,
-            **kwargs,
-        )
-        if key != comment_key:
-            seen_root = True
+    try:
+        for key, value in input_dict.items():
+            if key != comment_key and full_document and seen_root:
+                raise ValueError("Document must have exactly one root.")
+            _emit(
+                key,
+                value,
+                content_handler,
+                full_document=full_document,
+                encoding=encoding,
+                bytes_errors=bytes_errors,
+                comment_key=comment_key,
+                parallel=parallel,
+                **kwargs,
+            )
+            if key != comment_key:
+                seen_root = True
+    finally:
+        if parallel is not None:
+            parallel[0].shutdown(wait=True, cancel_futures=True)
     if full_document and not seen_root:
         raise ValueError("Document must have exactly one root.")
     if full_document:
         content_handler.endDocument()
+    content_handler.flush()
     if must_return:
         value = output.getvalue()
+        if as_bytes:
+            return value
         try:  # pragma no cover
             value = value.decode(encoding)
         except AttributeError:  # pragma no cover
@@ -624,16 +2686,526 @@ def unparse(input_dict, output=None, encoding='utf-8', full_document=True,
         return value
 
 
-if __name__ == '__main__':  # pragma: no cover
-    import marshal
-    import sys
+def unparse_records(records, root, output=None, item_name=None,
+                    root_attrs=None, encoding='utf-8', full_document=True,
+                    short_empty_elements=False, buffer_size=65536,
+                    as_bytes=False, **kwargs):
+    """Write many records as the children of a single `root` element.
+
+    This is the streaming counterpart of ``unparse({root: {item_name:
+    list(records)}})``: records are consumed one at a time from any iterable
+    (e.g. parsed JSON Lines) and written through a single XML generator, so
+    neither the records nor the output need to fit in memory when `output`
+    is a file. The output is identical to that `unparse` call.
+
+    If `item_name` is given, each record is the content of one `item_name`
+    element. Otherwise each record is a dict whose keys become the child
+    elements, as with ``unparse(record, full_document=False)``. `root_attrs`
+    is an optional mapping of attributes for the root element. The other
+    arguments are the same as for :func:`unparse`::
+
+        >>> xmltodict.unparse_records([{'@id': '1'}, {'@id': '2'}], 'rows',
+        ...                           item_name='row', full_document=False)
+        '<rows><row id="1"></row><row id="2"></row></rows>'
+    """
+    bytes_errors = kwargs.pop('bytes_errors', 'replace')
+    _check_bytes_errors(bytes_errors)
+    _validate_name(root, "element")
+    attrs = {}
+    for name, value in (root_attrs or {}).items():
+        _validate_name(name, "attribute")
+        attrs[name] = '' if value is None else _convert_value_to_string(
+            value, encoding=encoding, bytes_errors=bytes_errors)
+    pretty = kwargs.get('pretty', False)
+    newl = kwargs.get('newl', '\n')
+
+    must_return = False
+    if output is None:
+        output = BytesIO() if as_bytes else StringIO()
+        must_return = True
+    if must_return and not as_bytes:
+        buffer_size = 0
+    content_handler = _XMLGenerator(output, encoding, short_empty_elements,
+                                    buffer_size)
+    if full_document:
+        content_handler.startDocument()
+    content_handler.startElement(root, AttributesImpl(attrs))
+    empty = True
+    for record in records:
+        if pretty and empty:
+            content_handler.ignorableWhitespace(newl)
+        empty = False
+        if item_name is not None:
+            record = {item_name: record}
+        for key, value in record.items():
+            _emit(key, value, content_handler, depth=1, encoding=encoding,
+                  bytes_errors=bytes_errors, **kwargs)
+    content_handler.endElement(root)
+    if full_document:
+        content_handler.endDocument()
+    content_handler.flush()
+    if must_return:
+        return output.getvalue()
+
+
+_TEMPLATE_OPTIONS = frozenset((
+    'encoding', 'full_document', 'short_empty_elements', 'comment_key',
+    'attr_prefix', 'cdata_key', 'pretty', 'newl', 'indent',
+    'namespace_separator', 'namespaces', 'bytes_errors',
+))
+
+
+def compile_template(sample, **kwargs):
+    """Compile a fast serializer for dicts shaped like `sample`.
+
+    Returns a function that renders a dict to the same string `unparse` would
+    return for it with the given keyword arguments. Tag strings, attribute
+    names, namespace expansion and name validation are worked out once from
+    `sample`; each call then only checks that every dict has the same keys in
+    the same order and converts and escapes the values. Elements that do not
+    match the sample (different keys, a dict where the sample had text, and
+    so on) are rendered by the regular `unparse` code, so the result is
+    always the same as calling `unparse`::
+
+        >>> render = xmltodict.compile_template(
+        ...     {'r': {'@id': '1', 'v': ['x']}}, full_document=False)
+        >>> render({'r': {'@id': '2', 'v': ['y', 'z']}})
+        '<r id="2"><v>y</v><v>z</v></r>'
+
+    Lists in `sample` are compiled from their first item. A `preprocessor`,
+    `expand_iter` or comments in the sample disable the fast path.
+    """
+    options = dict(kwargs)
+    bytes_errors = options.get('bytes_errors', 'replace')
+    _check_bytes_errors(bytes_errors)
 
+    def generic(input_dict):
+        return unparse(input_dict, **options)
+
+    comment_key = options.get('comment_key', '#comment')
+    if (not options.keys() <= _TEMPLATE_OPTIONS or len(sample) != 1
+            or comment_key in sample):
+        return generic
+    compiler = _TemplateCompiler(options)
+    (root_key, root_sample), = sample.items()
+    root = compiler.element(root_key, root_sample, 0)
+    full_document = options.get('full_document', True)
+    header = ('<?xml version="1.0" encoding="%s"?>\n'
+              % options.get('encoding', 'utf-8'))
+
+    def render(input_dict):
+        if input_dict.__class__ is not dict or len(input_dict) != 1:
+            return generic(input_dict)
+        value = input_dict.get(root_key, _MISSING)
+        if value is _MISSING or (full_document and _is_sequence(value)):
+            return generic(input_dict)
+        parts = [header] if full_document else []
+        root(value, parts)
+        return ''.join(parts)
+
+    return render
+
+
+_MISSING = object()
+
+
+def _is_sequence(value):
+    return hasattr(value, '__iter__') and not isinstance(
+        value, _NON_SEQUENCE_TYPES)
+
+
+class _TemplateCompiler:
+    """Builds the render functions used by :func:`compile_template`.
+
+    Every function appends the XML for one element to a list of strings,
+    mirroring what `_emit` sends through `_XMLGenerator`.
+    """
+
+    def __init__(self, options):
+        self.attr_prefix = options.get('attr_prefix', '@')
+        self.cdata_key = options.get('cdata_key', '#text')
+        self.comment_key = options.get('comment_key', '#comment')
+        self.pretty = options.get('pretty', False)
+        self.newl = options.get('newl', '\n')
+        indent = options.get('indent', '\t')
+        self.indent = ' ' * indent if isinstance(indent, int) else indent
+        self.namespace_separator = options.get('namespace_separator', ':')
+        self.namespaces = options.get('namespaces')
+        self.encoding = options.get('encoding', 'utf-8')
+        self.bytes_errors = options.get('bytes_errors', 'replace')
+        self.short_empty_elements = options.get('short_empty_elements', False)
+        self.emit_options = dict(
+            attr_prefix=self.attr_prefix, cdata_key=self.cdata_key,
+            pretty=self.pretty, newl=self.newl, indent=self.indent,
+            namespace_separator=self.namespace_separator,
+            namespaces=self.namespaces, encoding=self.encoding,
+            bytes_errors=self.bytes_errors, comment_key=self.comment_key)
+
+    def _string(self, value):
+        return _convert_value_to_string(value, encoding=self.encoding,
+                                        bytes_errors=self.bytes_errors)
+
+    def generic(self, key, depth):
+        def render(item, parts):
+            output = StringIO()
+            content_handler = _XMLGenerator(output, self.encoding,
+                                            self.short_empty_elements)
+            _emit(key, [item], content_handler, depth=depth,
+                  full_document=False, **self.emit_options)
+            xml = output.getvalue()
+            if xml:
+                parts.append(xml)
+        return render
+
+    def element(self, key, sample, depth):
+        """Return a function rendering the value of `key` (an item or a
+        sequence of items) at `depth`."""
+        if _is_sequence(sample):
+            sample = next(iter(sample), None)
+        if isinstance(sample, _MAPPING_TYPES):
+            render_item = self.dict_item(key, sample, depth)
+        else:
+            render_item = self.text_item(key, depth)
+
+        def render(value, parts):
+            if value.__class__ is list or _is_sequence(value):
+                for item in value:
+                    render_item(item, parts)
+            else:
+                render_item(value, parts)
+        return render
+
+    def _tags(self, key, depth):
+        name = _process_namespace(key, self.namespaces,
+                                  self.namespace_separator, self.attr_prefix)
+        _validate_name(name, "element")
+        indent = depth * self.indent if self.pretty else ''
+        tail = self.newl if self.pretty and depth else ''
+        return indent + '<' + name, '</' + name + '>' + tail, tail
+
+    def text_item(self, key, depth):
+        generic = self.generic(key, depth)
+        start, end, tail = self._tags(key, depth)
+        empty = start + ('/>' + tail if self.short_empty_elements
+                         else '>' + end)
+        start += '>'
+        string = self._string
+
+        def render(item, parts):
+            if item.__class__ is str:
+                text = item
+            elif item is None:
+                text = None
+            elif isinstance(item, _MAPPING_TYPES) or _is_sequence(item):
+                return generic(item, parts)
+            else:
+                text = string(item)
+            if text:
+                parts.append(start + escape(text) + end)
+            else:
+                parts.append(empty)
+        return render
+
+    def dict_item(self, key, sample, depth):
+        generic = self.generic(key, depth)
+        keys = tuple(sample)
+        entries = []
+        attr_names = set()
+        for entry_key, entry_sample in sample.items():
+            if entry_key == self.cdata_key:
+                entries.append((_TEXT, None))
+            elif (isinstance(entry_key, str)
+                    and entry_key.startswith(self.attr_prefix)):
+                name = _process_namespace(entry_key, self.namespaces,
+                                          self.namespace_separator,
+                                          self.attr_prefix)
+                name = name[len(self.attr_prefix):]
+                _validate_name(name, "attribute")
+                if name == 'xmlns' or name in attr_names:
+                    return generic
+                attr_names.add(name)
+                entries.append((_ATTR, ' ' + name + '='))
+            elif entry_key == self.comment_key:
+                return generic
+            else:
+                entries.append(
+                    (_CHILD, self.element(entry_key, entry_sample, depth + 1)))
+        start, end, tail = self._tags(key, depth)
+        indent = depth * self.indent if self.pretty else ''
+        newl = self.newl if self.pretty else ''
+        empty_end = '/>' + tail if self.short_empty_elements else None
+        string = self._string
+
+        def render(item, parts):
+            if item.__class__ is not dict or tuple(item) != keys:
+                return generic(item, parts)
+            tag = [start]
+            text = None
+            children = []
+            for (kind, data), value in zip(entries, item.values()):
+                if kind is _ATTR:
+                    if value is None:
+                        value = ''
+                    elif value.__class__ is not str:
+                        value = string(value)
+                    tag.append(data)
+                    tag.append(quoteattr(value))
+                elif kind is _CHILD:
+                    if value.__class__ is list and not value:
+                        continue
+                    children.append((data, value))
+                elif value is not None:
+                    text = value if value.__class__ is str else string(value)
+            parts.append(''.join(tag))
+            mark = len(parts)
+            if children:
+                if newl:
+                    parts.append(newl)
+                for render_child, value in children:
+                    render_child(value, parts)
+            if text:
+                parts.append(escape(text))
+            if children and indent:
+                parts.append(indent)
+            if empty_end is not None and len(parts) == mark:
+                parts[-1] += empty_end
+            else:
+                parts[mark - 1] += '>'
+                parts.append(end)
+        return render
+
+
+_TEXT, _ATTR, _CHILD = object(), object(), object()
+
+
+_COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+
+def _open_input(path, stack):
+    if path == '-':
+        stream = sys.stdin.buffer
+    else:
+        stream = stack.enter_context(open(path, 'rb'))
+    head = stream.peek(6)[:6] if hasattr(stream, 'peek') else b''
+    for magic, module in _COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            module = __import__(module)
+            return stack.enter_context(module.open(stream))
+    return stream
+
+
+class _CountingWriter(BufferedIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.stream.write(data)
+        self.count += len(data)
+        return len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class _CountingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.count += len(line)
+            yield line
+
+
+def _cli_convert(source, out, args, options):
+    if args.unparse:
+        text = TextIOWrapper(out, encoding=args.encoding or 'utf-8')
+        if args.format == 'jsonl' and args.root:
+            records = (json.loads(line) for line in source if line.strip())
+            unparse_records(records, args.root, text,
+                            item_name=args.item_name, **options)
+            text.write('\n')
+        elif args.format == 'jsonl':
+            for line in source:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("JSON Lines records must be objects")
+                unparse(record, text, full_document=False, **options)
+                text.write('\n')
+        else:
+            unparse(json.load(source), text, **options)
+            text.write('\n')
+        text.flush()
+        text.detach()
+    elif args.format == 'marshal':
+        def handle_item(path, item):
+            marshal.dump((path, item), out)
+            return True
+
+        root = parse(source, item_depth=args.item_depth,
+                     item_callback=handle_item, **options)
+        if args.item_depth == 0:
+            handle_item([], root)
+    else:
+        text = TextIOWrapper(out, encoding='utf-8', newline='\n')
+        xml_to_json(source, text, args.item_depth,
+                    lines=args.format == 'jsonl',
+                    json_options={'indent': args.indent,
+                                  'ensure_ascii': False}, **options)
+        if not args.item_depth or args.format == 'json':
+            text.write('\n')
+        text.flush()
+        text.detach()
+
+
+_CLI_EXTENSIONS = {'json': '.json', 'jsonl': '.jsonl', 'marshal': '.marshal'}
+
+
+def _cli_output_path(path, args):
+    name = os.path.basename(path)
+    for suffix in ('.gz', '.bz2', '.xz', '.xml', '.jsonl', '.json'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    extension = '.xml' if args.unparse else _CLI_EXTENSIONS[args.format]
+    return os.path.join(args.output_dir, name + extension)
+
+
+def _cli_process(path, args, options, stream=None):
+    """Convert one input; returns `(bytes read, bytes written, output)`.
+
+    The result is written to `stream` if given, to a file in
+    `args.output_dir` if set, and otherwise returned as `output`.
+    """
+    from contextlib import ExitStack
+    with ExitStack() as stack:
+        source = _CountingReader(_open_input(path, stack))
+        if args.output_dir:
+            out = stack.enter_context(open(_cli_output_path(path, args), 'wb'))
+        elif stream is not None:
+            out = _CountingWriter(stream)
+        else:
+            out = BytesIO()
+        _cli_convert(source, out, args, options)
+        if args.output_dir:
+            return source.count, out.tell(), None
+        if stream is not None:
+            out.flush()
+            return source.count, out.count, None
+        output = out.getvalue()
+        return source.count, len(output), output
+
+
+def _cli_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m xmltodict',
+        description='Convert XML files to JSON, JSON Lines or marshal '
+                    'dumps, or JSON back to XML with --unparse.')
+    parser.add_argument(
+        'inputs', nargs='*', metavar='INPUT',
+        help='input files or glob patterns; "-" or nothing reads stdin. '
+             'gzip, bz2 and xz input is decompressed automatically.')
+    parser.add_argument('-f', '--format', default='jsonl',
+                        choices=sorted(_CLI_EXTENSIONS),
+                        help='JSON flavor to write (or read with --unparse)')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('--output-dir',
+                        help='write one output file per input into this '
+                             'directory')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of files to convert in parallel')
+    parser.add_argument('--stats', action='store_true',
+                        help='print throughput statistics to stderr')
+    parser.add_argument('--indent', type=int,
+                        help='indentation for JSON output or pretty XML')
+    group = parser.add_argument_group('parse options')
+    group.add_argument('-d', '--item-depth', type=int, default=0,
+                       help='stream the items found at this depth')
+    group.add_argument('--encoding')
+    group.add_argument('--no-attribs', dest='xml_attribs',
+                       action='store_false')
+    group.add_argument('--attr-prefix', default='@')
+    group.add_argument('--cdata-key', default='#text')
+    group.add_argument('--cdata-separator', default='')
+    group.add_argument('--force-cdata', action='store_true')
+    group.add_argument('--force-list', action='append', metavar='NAME')
+    group.add_argument('--no-strip-whitespace', dest='strip_whitespace',
+                       action='store_false')
+    group.add_argument('--process-namespaces', action='store_true')
+    group.add_argument('--namespace-separator', default=':')
+    group.add_argument('--namespace', action='append', default=[],
+                       metavar='URI=PREFIX',
+                       help='collapse a namespace URI to a prefix (an empty '
+                            'prefix drops it)')
+    group.add_argument('--process-comments', action='store_true')
+    group.add_argument('--comment-key', default='#comment')
+    group.add_argument('--allow-entities', dest='disable_entities',
+                       action='store_false')
+    for limit in ('depth', 'elements', 'attributes', 'text-length', 'bytes'):
+        group.add_argument(f'--max-{limit}', type=int)
+    group = parser.add_argument_group('unparse options')
+    group.add_argument('--unparse', action='store_true',
+                       help='convert JSON input to XML')
+    group.add_argument('--pretty', action='store_true')
+    group.add_argument('--short-empty-elements', action='store_true')
+    group.add_argument('--root', metavar='NAME',
+                       help='write all JSON Lines records into one document '
+                            'under this root element')
+    group.add_argument('--item-name', metavar='NAME',
+                       help='with --root, wrap each record in this element')
+    return parser
+
+
+def _cli_options(args):
+    if args.unparse:
+        options = dict(attr_prefix=args.attr_prefix, cdata_key=args.cdata_key,
+                       comment_key=args.comment_key, pretty=args.pretty,
+                       short_empty_elements=args.short_empty_elements,
+                       namespace_separator=args.namespace_separator)
+        if args.encoding:
+            options['encoding'] = args.encoding
+        if args.indent is not None:
+            options['indent'] = args.indent
+        return options
+    options = dict(
+        encoding=args.encoding, xml_attribs=args.xml_attribs,
+        attr_prefix=args.attr_prefix, cdata_key=args.cdata_key,
+        cdata_separator=args.cdata_separator, force_cdata=args.force_cdata,
+        force_list=tuple(args.force_list) if args.force_list else None,
+        strip_whitespace=args.strip_whitespace,
+        process_namespaces=args.process_namespaces,
+        namespace_separator=args.namespace_separator,
+        process_comments=args.process_comments, comment_key=args.comment_key,
+        disable_entities=args.disable_entities, max_depth=args.max_depth,
+        max_elements=args.max_elements, max_attributes=args.max_attributes,
+        max_text_length=args.max_text_length, max_bytes=args.max_bytes)
+    if args.namespace:
+        options['namespaces'] = dict(
+            (uri, prefix or None) for uri, _, prefix in
+            (spec.rpartition('=') for spec in args.namespace))
+    return options
+
+
+def _legacy_main(item_depth):
     stdin = sys.stdin.buffer
     stdout = sys.stdout.buffer
 
-    (item_depth,) = sys.argv[1:]
-    item_depth = int(item_depth)
-
     def handle_item(path, item):
         marshal.dump((path, item), stdout)
         return True
@@ -647,3 +3219,81 @@ if __name__ == '__main__':  # pragma: no cover
             handle_item([], root)
     except KeyboardInterrupt:
         pass
+    return 0
+
+
+def _main(argv=None):
+    import glob
+    if argv is None:
+        argv = sys.argv[1:]
+    # `xmltodict.py 2` predates the option parser: marshal items at depth 2.
+    if len(argv) == 1 and argv[0].isdigit():
+        return _legacy_main(int(argv[0]))
+    parser = _cli_parser()
+    args = parser.parse_args(argv)
+    if args.output and args.output_dir:
+        parser.error('--output and --output-dir are mutually exclusive')
+    if args.unparse and args.format == 'marshal':
+        parser.error('--unparse reads json or jsonl input')
+    if args.indent is not None and not args.unparse and args.format != 'json':
+        parser.error('--indent only applies to -f json output')
+    paths = []
+    for pattern in args.inputs or ['-']:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    options = _cli_options(args)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        out = None
+    elif args.output:
+        out = open(args.output, 'wb')
+    else:
+        out = sys.stdout.buffer
+
+    started = time.perf_counter()
+    if args.workers > 1 and len(paths) > 1:
+        executor = _make_executor(args.workers)
+        results = executor.map(_cli_process_safe, paths,
+                               [args] * len(paths), [options] * len(paths))
+    else:
+        # Converting one file at a time: write straight to the output
+        # instead of holding each result in memory.
+        executor = None
+        results = (_cli_process_safe(path, args, options, out)
+                   for path in paths)
+    status = 0
+    total_in = total_out = 0
+    try:
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                sys.stderr.write(f'xmltodict: {path}: {result}\n')
+                status = 1
+                continue
+            read, written, output = result
+            total_in += read
+            total_out += written
+            if output is not None:
+                out.write(output)
+                out.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if args.output and out is not None:
+            out.close()
+    if args.stats:
+        elapsed = time.perf_counter() - started
+        rate = total_in / elapsed / 1e6 if elapsed else 0.0
+        sys.stderr.write(
+            f'{len(paths)} files, {total_in} bytes in, {total_out} bytes out, '
+            f'{elapsed:.3f}s, {rate:.1f} MB/s\n')
+    return status
+
+
+def _cli_process_safe(path, args, options, stream=None):
+    try:
+        return _cli_process(path, args, options, stream)
+    except (OSError, ValueError, expat.ExpatError) as exc:
+        return exc
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(_main())